@@ -1,306 +1,742 @@
-import os, json
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import os, json, time, asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Union
 import pandas as pd
-from sqlalchemy import create_engine, desc, or_, text, MetaData, Table
-from sqlalchemy.orm import sessionmaker
-from utils import Logger
+from sqlalchemy import or_, select, text
+from utils import Logger, parse_list_literal, configure_logging, HEAD, KST
 from datetime import datetime
-import ast
 from model import JobInformation, DevStack, JobStack, Category, IncludeCategory, Industry, IndustryRelation
+from db import EngineRegistry, DatabaseExecutor, SessionScope
+from config import ConfigStore
+from search_index import KeywordIndexRegistry, is_indexable
+from loaders import load_job_information, DEFAULT_RELATIONS
+from facets import count_facets, count_facets_in_index
+from search import build_ranked_search, ranked_page, DEFAULT_LIMIT as SEARCH_DEFAULT_LIMIT, MAX_LIMIT as SEARCH_MAX_LIMIT
+from ingest import TermLookup, ingest_postings, INGEST_RELATIONS, DEFAULT_CHUNK_SIZE
+from cache import JobCache
+from unique_values import UniqueValuesStore
+from catalog import SchemaCatalog
+from row_counts import RowCountStore, approximate_row_count, MODES as ROW_COUNT_MODES
+from metrics import Metrics, RequestTiming, TimedRoute, request_timing, instrument_engines, pool_collector, PROMETHEUS_MEDIA_TYPE
+from query_cache import QueryResultCache, CachedResponse, is_cacheable, referenced_tables
+from serialization import FastJSONResponse, CompressionMiddleware, COMPRESSION_DEFAULTS, dumps
+from formats import MEDIA_TYPES, DEFAULT_FORMAT, negotiate_format, fetch_rows, to_columns, encode_columns
+from streaming import NDJSON_MEDIA_TYPE, stream_rows, astream_rows, stream_values, paginate_sorted, keyset_query
 
 parent_path = os.path.dirname(os.path.abspath(__file__))
-config_path = f"{parent_path}/config.json"
-app = FastAPI()
+config_path = os.environ.get("TMI_CONFIG_PATH", f"{parent_path}/config.json")
 logger = Logger()
 
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    await warmup()
+    yield
+    # close pooled connections of this worker on shutdown
+    config_store.stop_watching()
+    await db_executor.dispose()
+    logger.flush()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+app.router.route_class = TimedRoute
+metrics = Metrics()
+TimedRoute.metrics = metrics
+instrument_engines(metrics)
+# added before log_request, so logged latency includes compression
+compression_options = dict(COMPRESSION_DEFAULTS)
+app.add_middleware(CompressionMiddleware, options=compression_options)
+
+@app.middleware("http")
+async def log_request(request:Request, call_next):
+    """log and record method, path, status, latency and database time of every request once it is answered."""
+    method_name = __name__ + ".log_request"
+    start = time.perf_counter()
+    status = 500
+    timing = RequestTiming(request.url.path)
+    request_timing.set(timing)
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        latency = time.perf_counter() - start
+        # label by route template, so path parameters do not create new series
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.observe_request(request.method, path, status, latency, timing)
+        logger.log(f"request completed", flag=4, name=method_name, method=request.method, path=request.url.path, status=status,
+                   latency_ms=round(latency * 1000, 3), db_ms=round(timing.db_seconds * 1000, 3), statements=timing.statements, rows=timing.rows)
+
 ### input models
 class QueryCall(BaseModel):
     database: str
     query : str
+    key_column: Optional[str] = None
+    cursor: Optional[Union[int, str]] = None
+    limit: Optional[int] = None
+    stream: bool = False
+    format: Optional[str] = None
 
 class UniqueValuesCall(BaseModel):
     database:str
     table:str
     column:str
     is_stacked:bool
+    top_n:Optional[int] = None
+    with_counts:bool = False
+
+class RowCountCall(BaseModel):
+    database:str
+    table:str
+    filters:Optional[Dict[str, Union[str, int, None, List[Union[str, int]]]]] = None
+    mode:str = "exact"
+
+class FacetCall(BaseModel):
+    database:str
+    facets:Optional[List[str]] = None
+    pid_list:Optional[List[str]] = None
+    search_keyword:Optional[str] = None
+    top_n:Optional[int] = None
+
+class SearchCall(BaseModel):
+    database:str
+    keyword:Optional[str] = None
+    dev_stacks:Optional[List[str]] = None
+    categories:Optional[List[str]] = None
+    industries:Optional[List[str]] = None
+    site_symbol:Optional[List[str]] = None
+    required_career:Optional[List[str]] = None
+    start_date:Optional[datetime] = None
+    end_date:Optional[datetime] = None
+    cursor:Optional[str] = None
+    limit:int = SEARCH_DEFAULT_LIMIT
+    include:Optional[List[str]] = None
+    with_facets:bool = False
+
+class PostingCall(BaseModel):
+    pid:str
+    job_title:Optional[str] = None
+    site_symbol:Optional[str] = None
+    job_prefer:Optional[Union[str, List[str]]] = None
+    crawl_url:Optional[str] = None
+    start_date:Optional[datetime] = None
+    end_date:Optional[datetime] = None
+    post_status:Optional[str] = None
+    get_date:Optional[datetime] = None
+    required_career:Optional[str] = None
+    resume_required:Optional[str] = None
+    crawl_domain:Optional[str] = None
+    company_name:Optional[str] = None
+    job_requirements:Optional[Union[str, List[str]]] = None
+    dev_stacks:Optional[List[str]] = None
+    categories:Optional[List[str]] = None
+    industries:Optional[List[str]] = None
+
+class IngestCall(BaseModel):
+    database:str
+    postings:List[PostingCall]
+    chunk_size:Optional[int] = Field(None, gt=0)
 
 class MetaDataCall(BaseModel):
     database:str
     table:str
 
+class DatabaseCall(BaseModel):
+    database:str
+
+class JobInformationCall(BaseModel):
+    database:str
+    pid_list:List[str]
+    include:Optional[List[str]] = None
+
+### dependencies
+async def get_sessions():
+    '''yield request-scoped sessions, closing every opened session once the request is done.'''
+    sessions = SessionScope(db_executor)
+    try:
+        yield sessions
+    finally:
+        await sessions.aclose()
+
 ### API calls
 @app.post("/query")
-def query(input:QueryCall):
+async def query(input:QueryCall, request:Request):
+    """
+        run given query and return its records.
+        - key_column, cursor, limit(optional): keyset pagination over key_column, returning records after cursor with the next cursor
+        - stream(optional): stream records as NDJSON through a server-side cursor
+        - format(optional): "records" (default), "columns" for column-oriented JSON, "arrow" for an Arrow IPC stream or "parquet".
+          if not set, the format is negotiated from the Accept header. binary formats return the next cursor in the X-Next-Cursor header.
+    """
     method_name = __name__ + ".query"
     logger.log(f"api called", flag=0, name=method_name)
     try:
-        df = query_to_dataframe(input.database, input.query)
-        serialized_df = df.astype(object).to_dict(orient='records')
-        return serialized_df
+        response_format = negotiate_format(input.format, request.headers.get("accept"))
+        statement, params = input.query, {}
+        paged = input.limit is not None or input.cursor is not None
+        if paged:
+            if not input.key_column:
+                raise ValueError("key_column is required for paginated queries")
+            # fetch one extra record to know whether another page follows
+            statement, params = keyset_query(input.query, input.key_column, input.cursor, None if input.limit is None else input.limit + 1)
+        if input.stream:
+            return stream_response(input.database, text(statement) if params else statement, params)
+        async def compute():
+            if response_format != DEFAULT_FORMAT:
+                return await columnar_body(input, statement, params, response_format, paged)
+            df = await query_to_dataframe_async(input.database, statement, params)
+            # converting and encoding large results takes long enough to stall every request of the worker on the event loop
+            return await run_in_threadpool(records_body, input, df, paged)
+        cached = await cached_response(input.database, input.query, compute, params, ("query", input.key_column, response_format))
+        return Response(content=cached.content, media_type=cached.media_type, headers=cached.headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Exception occurred while querying from database: {e}")
 
 @app.post("/unique_values")
-def retrieve_unique_values(input: UniqueValuesCall):
+async def retrieve_unique_values(input: UniqueValuesCall, sessions:SessionScope=Depends(get_sessions)):
+    """
+        return unique values of given column, served from the precomputed unique values store.
+        - is_stacked: whether the column holds stringified lists whose elements are counted separately
+        - top_n(optional): return only the top_n most frequent values, in descending frequency
+        - with_counts(optional): also return the number of rows holding each value
+    """
     method_name = __name__ + ".retrieve_unique_values"
     logger.log(f"api called", flag=0, name=method_name)
-    database = input.database
-    table = input.table
-    column = input.column
-    is_stacked = input.is_stacked
-    separator = -1
-
     try:
-        engine = create_db_engine(database)
-        Session = sessionmaker(bind=engine)
-        session = Session()
-
-        if is_stacked:
-            separator = 0
-            # Handle stacked column data
-            model = get_model_from_table(table)
-            query = session.query(getattr(model, column)).filter(
-                getattr(model, column) != '[]',
-                getattr(model, column) != "['null']"
-            ).all()
-            all_elems = []
-            separator = 1
-            for row in query:
-                try:
-                    col_elem_list = ast.literal_eval(row[0])  # row is a tuple, so row[0] accesses the column data
-                except (SyntaxError, ValueError) as e:
-                    logger.log(f"Error parsing row: {row}, error: {e}", flag=1, name=method_name)
-                    continue  # Skip the erroneous row
-                all_elems.extend(col_elem_list)
-            unique_stacked_elem_list = list(set(all_elems))
-            return {"unique_values": unique_stacked_elem_list}
-        else:
-            separator = 2
-            # Handle distinct values from a column
-            model = get_model_from_table(table)
-            query = session.query(getattr(model, column)).distinct().all()
-            separator = 3
-            unique_elem_list = list(set(row[0] for row in query))
-            return {"unique_values": unique_elem_list}
+        model = get_model_from_table(input.table)
+        values = await sessions.run_threaded(input.database, unique_values_store.get, input.database, model, input.column, input.is_stacked)
+        result = {"unique_values": values.values(input.top_n)}
+        if input.with_counts:
+            result["counts"] = values.value_counts(input.top_n)
+        return result
     except Exception as e:
-        logger.log(f"Exception occurred while retrieving unique values from table on separator #{separator}: {e}", flag=1, name=method_name)
+        logger.log(f"Exception occurred while retrieving unique values from table: {e}", flag=1, name=method_name)
         raise HTTPException(status_code=500, detail=f"Exception occurred while retrieving unique values from table: {e}")
 
 @app.post("/columns")
-def get_columns(input:MetaDataCall):
+async def get_columns(input:MetaDataCall, sessions:SessionScope=Depends(get_sessions)):
+    """return column names of given table from the schema catalog."""
     method_name = __name__ + ".get_columns"
     logger.log(f"api called", flag=0, name=method_name)
-    database = input.database
-    table_name = input.table
     try:
-        engine = create_db_engine(database)
-        metadata = MetaData()
-        table = Table(table_name, metadata, autoload_with=engine)
-        column_names = [col.name for col in table.columns]
-        return {"column_names":column_names}
+        schema = await get_table_schema(sessions, input.database, input.table)
+        return {"column_names":schema.columns}
     except Exception as e:
         logger.log(f"",flag=1, name=method_name)
         raise HTTPException(status_code=500, detail=f"Exception occurred while retrieving metadata of table:{e}")
 
 @app.post("/row_count")
-def get_table_row_count(input:QueryCall):
+async def get_table_row_count(input:QueryCall, sessions:SessionScope=Depends(get_sessions)):
     method_name = __name__ + ".get_table_row_count"
     logger.log(f"api called", flag=0, name=method_name)
     try:
         database = input.database
         query = input.query
-        engine = create_db_engine(database)
-        # 연결하고 쿼리 실행
-        with engine.connect() as connection:
-            result = connection.execute(text(query))
-            row_count = result.scalar()  # 첫 번째 결과 값을 가져옴
-            return {"row_count": row_count}
+        async def compute():
+            # 연결하고 쿼리 실행
+            row_count = await sessions.run_connection(database, lambda connection: connection.execute(text(query)).scalar())  # 첫 번째 결과 값을 가져옴
+            return json_body({"row_count": row_count})
+        cached = await cached_response(database, query, compute, variant=("row_count",))
+        return Response(content=cached.content, media_type=cached.media_type)
     except Exception as e:
         logger.log(f"Exception occurred while getting table row count: {e}", flag=1, name=method_name)
         raise HTTPException(status_code=500, detail=f"Error retrieving row count: {e}")
 
+@app.post("/table_row_count")
+async def get_cached_row_count(input:RowCountCall, sessions:SessionScope=Depends(get_sessions)):
+    """
+        return number of rows of given table without scanning it on every call.
+        - filters(optional): column -> value, or list of values, rows must hold
+        - mode(optional): "approx" for the estimate of information_schema table statistics,
+          or "exact" for a cached count refreshed from get_date. approx falls back to exact with filters or without statistics.
+        the mode that answered is returned along with the count.
+    """
+    method_name = __name__ + ".get_cached_row_count"
+    logger.log(f"api called", flag=0, name=method_name)
+    try:
+        if input.mode not in ROW_COUNT_MODES:
+            raise ValueError(f"Unknown mode {input.mode}, expected one of {ROW_COUNT_MODES}")
+        model = get_model_from_table(input.table)
+        if input.mode == "approx" and not input.filters:
+            row_count = await sessions.run_connection(input.database, approximate_row_count, model.__tablename__)
+            if row_count is not None:
+                return {"row_count": row_count, "mode": "approx"}
+        count = await sessions.run_threaded(input.database, row_count_store.get, input.database, model, input.filters)
+        return {"row_count": count.total, "mode": "exact", "updated_at": datetime.fromtimestamp(count.updated_at, KST)}
+    except Exception as e:
+        logger.log(f"Exception occurred while counting rows of table: {e}", flag=1, name=method_name)
+        raise HTTPException(status_code=500, detail=f"Exception occurred while counting rows of table: {e}")
+
 @app.get("/stacked_columns")
-def get_stacked_columns(database:str, table:str):
+async def get_stacked_columns(database:str, table:str, sessions:SessionScope=Depends(get_sessions)):
+    """return columns of given table holding stringified lists, detected once when the schema catalog is built."""
     method_name = __name__ + ".get_stacked_columns"
     logger.log(f"api called", flag=0, name=method_name)
     try:
-        query = f"SELECT * FROM {table} LIMIT 100;"
-        result_df = query_to_dataframe(database, query)
-        stacked_columns = [col for col in result_df.columns if isinstance(result_df[col].iloc[0], str) and result_df[col].iloc[0].startswith('[')]
-        # logger.log(f"Retrieved data: {result_df}", flag=0, name=method_name)  # debugging log added
-        # stacked_columns = [col for col in result_df.columns if str(result_df[col].iloc[0]).startswith('[')]
-        return {"stacked_columns":stacked_columns}
+        schema = await get_table_schema(sessions, database, table)
+        return {"stacked_columns":schema.stacked_columns}
     except Exception as e:
         logger.log(f"Exception occurred while getting stacked columns as list: {e}", flag=1, name=method_name)
         raise HTTPException(status_code=500, detail=f"Exception occurred while getting stacked columns as list: {e}")
 
+@app.post("/schema_catalog/refresh")
+async def refresh_schema_catalog(input:DatabaseCall, sessions:SessionScope=Depends(get_sessions)):
+    """reflect every table of given database again, picking up schema changes and re-detecting stacked columns."""
+    method_name = __name__ + ".refresh_schema_catalog"
+    logger.log(f"api called", flag=0, name=method_name)
+    try:
+        await sessions.run_connection(input.database, schema_catalog.build, input.database)
+        return schema_catalog.stats().get(input.database)
+    except Exception as e:
+        logger.log(f"Exception occurred while refreshing schema catalog: {e}", flag=1, name=method_name)
+        raise HTTPException(status_code=500, detail=f"Exception occurred while refreshing schema catalog: {e}")
+
 @app.get("/dev_stacks")
-def get_dev_stacks(database:str):
+async def get_dev_stacks(database:str, sessions:SessionScope=Depends(get_sessions)):
     method_name = __name__ + ".get_dev_stacks"
     logger.log(f"api called", flag=0, name=method_name)
-    try:
-        engine = create_db_engine(database)
-        Session = sessionmaker(bind=engine)
-        session = Session()
+    def load_dev_stacks(session):
         dev_stacks = (
             session.query(DevStack.dev_stack)
             .join(JobStack, JobStack.did == DevStack.did)
             .all()
         )
-        dev_stack_list = [stack[0] for stack in dev_stacks]
+        return [stack[0] for stack in dev_stacks]
+    try:
+        dev_stack_list = await sessions.run_threaded(database, load_dev_stacks)
         return {"dev_stacks": dev_stack_list}
     except Exception as e:
         logger.log(f"Exception occurred while getting dev stacks: {e}", flag=1, name=method_name)
         raise HTTPException(status_code=500, detail=f"Exception occurred while getting dev stacks: {e}")
 
+@app.post("/facets")
+async def get_facets(input:FacetCall, sessions:SessionScope=Depends(get_sessions)):
+    """
+        return number of jobs per dev stack, category and industry, counted in SQL.
+        - facets(optional): facets to count among dev_stacks, categories and industries, defaults to every facet
+        - pid_list(optional): count only given jobs
+        - search_keyword(optional): count only jobs matching given keyword, as /search_keyword does
+        - top_n(optional): return only the top_n most frequent values per facet
+    """
+    method_name = __name__ + ".get_facets"
+    logger.log(f"api called", flag=0, name=method_name)
+    keyword = input.search_keyword
+    use_index = bool(keyword) and config_store.get().get("SEARCH_INDEX", True) and is_indexable(keyword)
+    def count(session):
+        pid_list, pid_query = input.pid_list, None
+        if keyword and use_index:
+            # a keyword can match every job, so its matches are counted from the index rather than sent back as IN lists
+            index = search_indexes.get_fresh(input.database, session)
+            matched = index.search(keyword)
+            pids = matched if pid_list is None else set(pid_list) & set(matched)
+            return count_facets_in_index(index, pids, input.facets, input.top_n)
+        if keyword:
+            # the first column of the union is the pid, see build_search_query
+            matched = build_search_query(session, keyword).subquery()
+            pid_query = select(list(matched.c)[0])
+        return count_facets(session, input.facets, pid_list, pid_query, input.top_n)
+    try:
+        return json_response({"facets": await sessions.run_threaded(input.database, count)})
+    except Exception as e:
+        logger.log(f"Exception occurred while counting facets: {e}", flag=1, name=method_name)
+        raise HTTPException(status_code=500, detail=f"Exception occurred while counting facets: {e}")
+
 @app.get("/search_keyword")
-def get_search_results(database: str, search_keyword: str):
+async def get_search_results(database: str, search_keyword: str, cursor:str=None, limit:int=None, stream:bool=False, sessions:SessionScope=Depends(get_sessions)):
+    """
+        return pids matching given keyword.
+        - cursor, limit(optional): keyset pagination over pid, returning pids after cursor with the next cursor
+        - stream(optional): stream pids as NDJSON lines
+    """
     method_name = __name__ + ".get_search_result"
     logger.log(f"api called", flag=0, name=method_name)
+    use_index = config_store.get().get("SEARCH_INDEX", True) and is_indexable(search_keyword)
+    def search(session):
+        if use_index:
+            index = search_indexes.get_fresh(database, session)
+            return paginate_sorted(index.search(search_keyword), cursor, limit)
+        result_pid_list = search_pids_sql(session, search_keyword, cursor, None if limit is None else limit + 1)
+        next_cursor = None
+        if limit is not None and len(result_pid_list) > limit:
+            result_pid_list = result_pid_list[:limit]
+            next_cursor = result_pid_list[-1] if result_pid_list else None
+        return result_pid_list, next_cursor
     try:
-        engine = create_db_engine(database)
-        Session = sessionmaker(bind=engine)
-        session = Session()
-
-        if search_keyword:
-            # Define the common columns for all queries
-            columns = [JobInformation.pid, JobInformation.job_title, JobInformation.site_symbol,
-                       JobInformation.crawl_url, JobInformation.crawl_domain, JobInformation.company_name]
-            
-            # Create individual queries with the same columns
-            query1 = session.query(*columns).filter(
-                or_(
-                    JobInformation.job_title.like(f"%{search_keyword}%"),
-                    JobInformation.site_symbol.like(f"%{search_keyword}%"),
-                    JobInformation.crawl_url.like(f"%{search_keyword}%"),
-                    JobInformation.crawl_domain.like(f"%{search_keyword}%"),
-                    JobInformation.company_name.like(f"%{search_keyword}%"),
-                )
-            )
-            
-            query2 = session.query(JobInformation.pid, JobInformation.job_title, JobInformation.site_symbol,
-                                   JobInformation.crawl_url, JobInformation.crawl_domain, JobInformation.company_name).join(
-                JobStack
-            ).join(
-                DevStack
-            ).filter(
-                DevStack.dev_stack.like(f"%{search_keyword}%")
-            )
+        if stream and not use_index:
+            statement = await sessions.run(database, lambda session: build_search_query(session, search_keyword, cursor, limit).statement)
+            return stream_response(database, statement, row_to_record=lambda row: {"pid": row[0]})
+        result_pid_list, next_cursor = await sessions.run_threaded(database, search)
+        if stream:
+            return StreamingResponse(stream_values(result_pid_list, lambda pid: {"pid": pid}), media_type=NDJSON_MEDIA_TYPE)
+        if limit is not None or cursor is not None:
+            return json_response({"result":result_pid_list, "next_cursor":next_cursor})
+        return json_response({"result":result_pid_list})
+    except Exception as e:
+        logger.log(f"Exception occurred while getting search results: {e}", flag=1, name=method_name)
+        raise HTTPException(status_code=500, detail=f"Exception occurred while getting search results: {e}")
 
-            query3 = session.query(JobInformation.pid, JobInformation.job_title, JobInformation.site_symbol,
-                                   JobInformation.crawl_url, JobInformation.crawl_domain, JobInformation.company_name).join(
-                IncludeCategory
-            ).join(
-                Category
-            ).filter(
-                Category.job_category.like(f"%{search_keyword}%")
-            )
+@app.post("/search")
+async def search(input:SearchCall, sessions:SessionScope=Depends(get_sessions)):
+    """
+        return jobs matching keyword and filters ranked by relevance, filtered and ranked in one query.
+        - keyword(optional): keyword matched as /search_keyword does, jobs matching it in more important fields rank first
+        - dev_stacks, categories, industries, site_symbol, required_career(optional): a job must hold one of the given values of every given filter
+        - start_date, end_date(optional): window the posting period of a job must overlap
+        - cursor, limit(optional): keyset pagination over (score, pid), returning jobs after cursor with the next cursor
+        - include(optional): relations to load, see /job_information
+        - with_facets(optional): also count dev stacks, categories and industries of every matching job, see /facets
+    """
+    method_name = __name__ + ".search"
+    logger.log(f"api called", flag=0, name=method_name)
+    filters = {name: getattr(input, name) for name in ('dev_stacks', 'categories', 'industries', 'site_symbol', 'required_career')}
+    limit = max(0, min(input.limit, SEARCH_MAX_LIMIT))
+    def run(session):
+        ranked = build_ranked_search(input.keyword, filters, input.start_date, input.end_date)
+        page, next_cursor = ranked_page(session, ranked, input.cursor, limit)
+        jobs = cached_job_information(session, input.database, [pid for pid, _ in page], input.include)
+        # keep the rank order rather than the get_date order of the job information
+        result = {"result": [{"pid": pid, "score": score, **jobs[pid]} for pid, score in page if pid in jobs], "next_cursor": next_cursor}
+        if input.with_facets:
+            result["facets"] = count_facets(session, pid_query=select(ranked.c.pid))
+        return result
+    try:
+        return json_response(await sessions.run_threaded(input.database, run))
+    except Exception as e:
+        logger.log(f"Exception occurred while searching jobs: {e}", flag=1, name=method_name)
+        raise HTTPException(status_code=500, detail=f"Exception occurred while searching jobs: {e}")
 
-            query4 = session.query(JobInformation.pid, JobInformation.job_title, JobInformation.site_symbol,
-                                   JobInformation.crawl_url, JobInformation.crawl_domain, JobInformation.company_name).join(
-                IndustryRelation
-            ).join(
-                Industry
-            ).filter(
-                Industry.industry_type.like(f"%{search_keyword}%")
-            )
+@app.get("/search_index/check")
+async def check_search_index(database:str, keywords:List[str]=Query(...), sessions:SessionScope=Depends(get_sessions)):
+    method_name = __name__ + ".check_search_index"
+    logger.log(f"api called", flag=0, name=method_name)
+    def check(session):
+        index = search_indexes.get_fresh(database, session)
+        report = index.check_consistency(session, keywords, search_pids_sql)
+        report["index"] = index.stats()
+        return report
+    try:
+        report = await sessions.run_threaded(database, check)
+        if not report["consistent"]:
+            logger.log(f"keyword index of {database} is inconsistent with sql search for {keywords}", flag=2, name=method_name)
+        return report
+    except Exception as e:
+        logger.log(f"Exception occurred while checking search index: {e}", flag=1, name=method_name)
+        raise HTTPException(status_code=500, detail=f"Exception occurred while checking search index: {e}")
 
-            # Combine queries using union
-            combined_query = query1.union(query2).union(query3).union(query4)
-        else:
-            # Select all columns if no search keyword is provided
-            combined_query = session.query(JobInformation.pid, JobInformation.job_title, JobInformation.site_symbol,
-                                           JobInformation.crawl_url, JobInformation.crawl_domain, JobInformation.company_name)
-
-        # Execute query and get results
-        result_proxy = combined_query.all()
-
-        # Convert results to DataFrame
-        df = pd.DataFrame(result_proxy, columns=['pid', 'job_title', 'site_symbol', 'crawl_url', 'crawl_domain', 'company_name'])
-        result_pid_list = df['pid'].to_list()
-        #serialized_df = df.astype(object).to_dict(orient='records')
-        #return serialized_df
-        return {"result":result_pid_list}
+@app.post("/search_index/rebuild")
+async def rebuild_search_index(input:DatabaseCall, sessions:SessionScope=Depends(get_sessions)):
+    method_name = __name__ + ".rebuild_search_index"
+    logger.log(f"api called", flag=0, name=method_name)
+    try:
+        index = search_indexes.get(input.database)
+        await sessions.run_threaded(input.database, index.build)
+        return index.stats()
     except Exception as e:
-        logger.log(f"Exception occurred while getting search results: {e}", flag=1, name=method_name)
-        raise HTTPException(status_code=500, detail=f"Exception occurred while getting search results: {e}")
+        logger.log(f"Exception occurred while rebuilding search index: {e}", flag=1, name=method_name)
+        raise HTTPException(status_code=500, detail=f"Exception occurred while rebuilding search index: {e}")
 
 @app.get("/job_information")
-def get_job_information(database: str, pid_list: str):
+async def get_job_information(database: str, pid_list: str = None, pid: List[str] = Query(None), include: List[str] = Query(None), sessions:SessionScope=Depends(get_sessions)):
+    """
+        return job information of given pids.
+        - pid_list(deprecated): stringified list of pids such as "['p1', 'p2']"
+        - pid: pid to look up, repeated per pid such as ?pid=p1&pid=p2
+        - include(optional): relations to load among dev_stacks, categories and industries, defaults to dev_stacks
+    """
     method_name = __name__ + ".get_job_information"
     logger.log(f"api called", flag=0, name=method_name)
     try:
-        pid_list = ast.literal_eval(pid_list)
-        engine = create_db_engine(database)
-        Session = sessionmaker(bind=engine)
-        session = Session()
-        result = {}
-
-        jobs = session.query(JobInformation).filter(JobInformation.pid.in_(pid_list)).order_by(desc(JobInformation.get_date)).all()
-
-        for job in jobs:
-            job_data = {
-                "job_title": job.job_title,
-                "company_name": job.company_name,
-                "dev_stacks": [stack.stack.dev_stack for stack in job.stacks],  # dev stack list
-                "job_prefer": ast.literal_eval(job.job_prefer),
-                "required_career": job.required_career,
-                "resume_required": job.resume_required,
-                "start_date": job.start_date,
-                "end_date": job.end_date,
-                "crawl_url": job.crawl_url,
-                "get_date":job.get_date
-            }
-            result[job.pid] = job_data
-        return result
+        pids = list(pid or [])
+        if pid_list:
+            pids.extend(parse_list_literal(pid_list))
+        return json_response(await sessions.run_threaded(database, cached_job_information, database, pids, include))
+    except Exception as e:
+        logger.log(f"Exception occurred while getting job information: {e}", flag=1, name=method_name)
+        raise HTTPException(status_code=500, detail=f"Exception occurred while getting job information: {e}")
 
+@app.post("/job_information")
+async def post_job_information(input:JobInformationCall, sessions:SessionScope=Depends(get_sessions)):
+    method_name = __name__ + ".post_job_information"
+    logger.log(f"api called", flag=0, name=method_name)
+    try:
+        return json_response(await sessions.run_threaded(input.database, cached_job_information, input.database, input.pid_list, input.include))
     except Exception as e:
         logger.log(f"Exception occurred while getting job information: {e}", flag=1, name=method_name)
         raise HTTPException(status_code=500, detail=f"Exception occurred while getting job information: {e}")
 
+@app.post("/ingest")
+async def ingest(input:IngestCall, sessions:SessionScope=Depends(get_sessions)):
+    """
+        upsert batch of crawled postings with their dev stacks, categories and industries, in one transaction per chunk.
+        - postings: job_information fields of each posting. fields a posting does not send keep their stored values,
+          except get_date, which defaults to the time of ingestion so in-memory stores pick the posting up.
+          job_prefer / job_requirements lists are stored as stringified lists.
+          dev_stacks, categories and industries name lists replace the links of a posting, creating unknown terms.
+        - chunk_size(optional): postings written per transaction, defaults to INGEST_CHUNK_SIZE or 1000
+        return rows written per table, created terms and rows per second.
+    """
+    method_name = __name__ + ".ingest"
+    logger.log(f"api called", flag=0, name=method_name)
+    database = input.database
+    postings = []
+    for posting in input.postings:
+        fields = posting.model_dump(exclude_unset=True)
+        for field in ('job_prefer', 'job_requirements'):
+            if isinstance(fields.get(field), list):
+                fields[field] = str(fields[field])
+        postings.append(fields)
+    chunk_size = input.chunk_size or config_store.get().get("INGEST_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+    try:
+        result = await sessions.run_connection(database, ingest_postings, database, postings, term_lookup, chunk_size)
+    except Exception as e:
+        logger.log(f"Exception occurred while ingesting postings: {e}", flag=1, name=method_name)
+        raise HTTPException(status_code=500, detail=f"Exception occurred while ingesting postings: {e}")
+    finally:
+        # chunks committed before a failure are visible as well
+        invalidate_ingested(database, [posting["pid"] for posting in postings])
+    return result
+
+@app.get("/job_cache/stats")
+async def get_job_cache_stats():
+    method_name = __name__ + ".get_job_cache_stats"
+    logger.log(f"api called", flag=0, name=method_name)
+    cache = get_job_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+@app.get("/query_cache/stats")
+async def get_query_cache_stats():
+    method_name = __name__ + ".get_query_cache_stats"
+    logger.log(f"api called", flag=0, name=method_name)
+    cache = get_query_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+@app.get("/metrics")
+async def get_metrics():
+    """expose request, statement and pool metrics of this worker in Prometheus text format."""
+    return Response(content=metrics.render(), media_type=PROMETHEUS_MEDIA_TYPE)
+
+@app.get("/pool_stats")
+async def get_pool_stats():
+    method_name = __name__ + ".get_pool_stats"
+    logger.log(f"api called", flag=0, name=method_name)
+    return db_executor.pool_stats()
+
 
 ### methods
-def load_config(config_path:str='config.json')->dict:
-    """return configuration informations from config.json"""
+config_store = ConfigStore(config_path)
+
+def load_config(config_path:str=config_path)->dict:
+    """return configuration informations from config.json, cached until the file changes"""
+    if config_path == config_store.path:
+        return config_store.get()
     with open(config_path, 'r') as f:
         return json.load(f)
 
-def create_db_engine(database:str, config=None):
-    """generate db engine through configuration file."""
-    method_name = __name__ + ".create_db_engine"
-    if config is None:
-        config = load_config()
+engine_registry = EngineRegistry(config_store)
+db_executor = DatabaseExecutor(engine_registry, config_store)
+config_store.on_change(db_executor.on_config_change)
+metrics.add_collector(pool_collector(db_executor.pool_stats))
+search_indexes = KeywordIndexRegistry(session_factory=engine_registry.get_session_factory)
+job_cache = None
+query_cache = None
+schema_catalog = SchemaCatalog()
+unique_values_store = UniqueValuesStore(session_factory=engine_registry.get_session_factory)
+row_count_store = RowCountStore(session_factory=engine_registry.get_session_factory)
+term_lookup = TermLookup()
+
+def get_job_cache()->JobCache:
+    """return job cache of this worker, created from configuration on first use. None if disabled."""
+    global job_cache
+    config = config_store.get()
+    if job_cache is None and config.get("JOB_CACHE", True):
+        job_cache = JobCache(
+            max_entries=config.get("JOB_CACHE_SIZE", 10000),
+            ttl=config.get("JOB_CACHE_TTL", 300),
+            path=config.get("JOB_CACHE_PATH"),
+            check_interval=config.get("JOB_CACHE_CHECK_INTERVAL", 30),
+        )
+    return job_cache
+
+def get_query_cache()->QueryResultCache:
+    """return query result cache of this worker, created from configuration on first use. None if disabled."""
+    global query_cache
+    config = config_store.get()
+    if query_cache is None and config.get("QUERY_CACHE", True):
+        query_cache = QueryResultCache(
+            max_bytes=config.get("QUERY_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+            ttl=config.get("QUERY_CACHE_TTL", 60),
+        )
+    return query_cache
+
+async def warmup():
+    """
+        load configuration once and prepare engines, pools and reflected tables before serving requests.
+        - WARMUP_DATABASES: databases to prepare on startup
+        - DATABASE_URLS(optional): database -> URL used instead of the MySQL endpoint, such as a local server or an SQLite file
+        - WARMUP_CONNECTIONS(optional): connections to open per database, defaults to pool size
+        - WARMUP_TABLES(optional): tables to add to the schema catalog per database, defaults to every table in model.py
+        - CONFIG_WATCH_INTERVAL(optional): seconds between checks for changes of config.json
+        - LOG_LEVEL(optional): lowest level written to log files, as flag or name such as "INFO" to drop debug logs in production
+        - LOG_FLUSH_INTERVAL / LOG_MAX_BYTES / LOG_ROTATE_WHEN / LOG_BACKUP_COUNT(optional): buffering and rotation of log files
+        - SLOW_QUERY_SECONDS(optional): statements slower than this are logged with their SQL as WARN
+        - COMPRESSION(optional): whether responses are compressed with gzip or zstd as negotiated by Accept-Encoding, defaults to True
+        - COMPRESSION_MIN_SIZE / COMPRESSION_GZIP_LEVEL / COMPRESSION_ZSTD_LEVEL(optional): smallest body compressed and compression levels
+        - DB_MODE(optional): "sync" to run database work on the threadpool, or "async" to run it on the event loop through ASYNC_DRIVER.
+          in-memory stores and job information are assembled on the threadpool in both modes.
+        - SEARCH_INDEX(optional): whether keyword search is answered by the in-memory index, defaults to True
+        - SEARCH_INDEX_REFRESH_INTERVAL / SEARCH_INDEX_REBUILD_INTERVAL(optional): seconds between incremental refreshes and full rebuilds
+        - UNIQUE_VALUES_REFRESH_INTERVAL / UNIQUE_VALUES_REBUILD_INTERVAL(optional): same as above, for the unique values store
+        - ROW_COUNT_REFRESH_INTERVAL / ROW_COUNT_REBUILD_INTERVAL(optional): same as above, for exact counts of /table_row_count
+    """
+    method_name = __name__ + ".warmup"
+    db_executor.loop = asyncio.get_running_loop()
     try:
-        user = config.get("USER")
-        password = config.get("PASSWORD")
-        host = config.get("ENDPOINT")
-        port = config.get("PORT")
-        connection_string = f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}"
-        return create_engine(connection_string)
+        config = config_store.get()
     except Exception as e:
-        logger.log(f"Exception occurred while creating db engine: {e}", flag=1, name=method_name)
-        raise e
-    
+        logger.log(f"Exception occurred while loading configuration: {e}", flag=1, name=method_name)
+        return
+    config_store.start_watching(config.get("CONFIG_WATCH_INTERVAL"))
+    apply_logging_config(None, config)
+    compression_options.update({
+        "enabled": config.get("COMPRESSION", compression_options["enabled"]),
+        "minimum_size": config.get("COMPRESSION_MIN_SIZE", compression_options["minimum_size"]),
+        "gzip_level": config.get("COMPRESSION_GZIP_LEVEL", compression_options["gzip_level"]),
+        "zstd_level": config.get("COMPRESSION_ZSTD_LEVEL", compression_options["zstd_level"]),
+    })
+    search_indexes.refresh_interval = config.get("SEARCH_INDEX_REFRESH_INTERVAL", search_indexes.refresh_interval)
+    search_indexes.rebuild_interval = config.get("SEARCH_INDEX_REBUILD_INTERVAL", search_indexes.rebuild_interval)
+    unique_values_store.refresh_interval = config.get("UNIQUE_VALUES_REFRESH_INTERVAL", unique_values_store.refresh_interval)
+    unique_values_store.rebuild_interval = config.get("UNIQUE_VALUES_REBUILD_INTERVAL", unique_values_store.rebuild_interval)
+    row_count_store.refresh_interval = config.get("ROW_COUNT_REFRESH_INTERVAL", row_count_store.refresh_interval)
+    row_count_store.rebuild_interval = config.get("ROW_COUNT_REBUILD_INTERVAL", row_count_store.rebuild_interval)
+    tables = config.get("WARMUP_TABLES", list(table_model_map.keys()))
+    for database in config.get("WARMUP_DATABASES", []):
+        start = time.perf_counter()
+        sessions = SessionScope(db_executor)
+        try:
+            if db_executor.is_async:
+                await db_executor.async_registry.warmup(database, connections=config.get("WARMUP_CONNECTIONS"))
+            else:
+                await run_in_threadpool(engine_registry.warmup, database, config.get("WARMUP_CONNECTIONS"))
+            await sessions.run_connection(database, schema_catalog.build, database, tables)
+            if config.get("SEARCH_INDEX", True):
+                await sessions.run_threaded(database, search_indexes.get(database).build)
+            logger.log(f"warmed up {database} in {time.perf_counter() - start:.3f}s", flag=3, name=method_name)
+        except Exception as e:
+            logger.log(f"Exception occurred while warming up {database}: {e}", flag=1, name=method_name)
+        finally:
+            await sessions.aclose()
+
+def apply_logging_config(previous:dict, current:dict):
+    """configure log level, buffering, rotation and slow query log of this worker from configuration."""
+    metrics.slow_query_seconds = current.get("SLOW_QUERY_SECONDS")
+    level = current.get("LOG_LEVEL")
+    if isinstance(level, str):
+        level = HEAD.index(level.upper())
+    configure_logging(
+        min_level=level,
+        flush_interval=current.get("LOG_FLUSH_INTERVAL"),
+        max_bytes=current.get("LOG_MAX_BYTES"),
+        rotate_when=current.get("LOG_ROTATE_WHEN"),
+        backup_count=current.get("LOG_BACKUP_COUNT"),
+    )
+
+config_store.on_change(apply_logging_config)
+
+def stream_response(database:str, statement, params:dict=None, row_to_record=None)->StreamingResponse:
+    """return NDJSON response streaming rows of given statement through the sync or async engine of given database."""
+    engine = db_executor.streaming_engine(database)
+    stream = astream_rows if db_executor.is_async else stream_rows
+    return StreamingResponse(stream(engine, statement, params, row_to_record), media_type=NDJSON_MEDIA_TYPE)
+
+def records_body(input:QueryCall, df:pd.DataFrame, paged:bool)->CachedResponse:
+    """return records of given DataFrame encoded to JSON, trimming the extra record fetched for pagination."""
+    with metrics.stage("dataframe"):
+        serialized_df = df.astype(object).to_dict(orient='records')
+    if paged:
+        next_cursor = None
+        if input.limit is not None and len(serialized_df) > input.limit:
+            serialized_df = serialized_df[:input.limit]
+            next_cursor = serialized_df[-1][input.key_column] if serialized_df else None
+        serialized_df = {"records": serialized_df, "next_cursor": next_cursor}
+    return json_body(serialized_df)
+
+async def columnar_body(input:QueryCall, statement:str, params:dict, response_format:str, paged:bool)->CachedResponse:
+    """return rows of given statement encoded column by column in given format, trimming the extra row fetched for pagination."""
+    names, rows = await db_executor.run_connection(input.database, fetch_rows, statement, params)
+    def encode()->tuple:
+        columns = to_columns(names, rows)
+        next_cursor = None
+        if paged and input.limit is not None and columns and len(columns[0]) > input.limit:
+            columns = [values[:input.limit] for values in columns]
+            next_cursor = columns[names.index(input.key_column)][-1] if input.limit > 0 else None
+        with metrics.stage("encode"):
+            return encode_columns(names, columns, response_format, next_cursor), next_cursor
+    content, next_cursor = await run_in_threadpool(encode)
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None and response_format != "columns" else None
+    return CachedResponse(content, MEDIA_TYPES[response_format], headers)
+
+def json_body(content)->CachedResponse:
+    """encode given content to JSON, without passing it through jsonable_encoder."""
+    with metrics.stage("encode"):
+        return CachedResponse(dumps(content), "application/json")
+
+def json_response(content)->FastJSONResponse:
+    """return JSON response of given content that FastAPI sends as is, skipping jsonable_encoder."""
+    with metrics.stage("encode"):
+        return FastJSONResponse(content)
+
+async def cached_response(database:str, query:str, compute, params:dict=None, variant:tuple=())->CachedResponse:
+    """
+        return serialized result of given read-only query from the query cache, awaiting compute() once on a miss.
+        - compute: coroutine function returning the CachedResponse of the query
+        - params, variant(optional): parameters and response options that are part of the cache key along with the normalized query
+    """
+    cache = get_query_cache()
+    if cache is None or not is_cacheable(query):
+        return await compute()
+    tables = referenced_tables(query)
+    async def compute_tagged():
+        response = await compute()
+        response.tables = tables
+        return response
+    return await cache.get_or_compute(cache.key(database, query, params, variant), compute_tagged)
+
+def invalidate_ingested(database:str, pid_list:list):
+    """drop cached results, job entries and term ids that ingested postings may have changed, and refresh the search index on next use."""
+    cache = get_query_cache()
+    if cache is not None:
+        cache.invalidate(database, [JobInformation.__tablename__] + [table for link, term, *_ in INGEST_RELATIONS.values() for table in (link.__tablename__, term.__tablename__)])
+    cache = get_job_cache()
+    if cache is not None:
+        cache.invalidate(database, pid_list)
+    search_indexes.expire(database)
+
+def invalidate_query_cache(database:str, query:str):
+    """drop cached results read from tables written by given statement, or every result of the database if they are unknown."""
+    cache = get_query_cache()
+    if cache is not None:
+        cache.invalidate(database, referenced_tables(query) or None)
+
 def execute_query(database:str, query:str, params:dict=None)->bool:
     """
     Execute SQL query and return True if successful, False otherwise.
     - database: database name to connect
     - query: SQL query to execute
     - params: parameters for the query (optional)
-    - config_path: path to config.json
     """
     method_name = __name__ + ".execute_query"
     try:
-        engine = create_db_engine(database)
+        engine = engine_registry.get_engine(database)
         
         with engine.connect() as connection:
             try:
-                if params:
-                    connection.execute(text(query), params)
-                else:
-                    connection.execute(text(query))
+                run_statement(connection, query, params)
                 connection.commit()
+                invalidate_query_cache(database, query)
 
             except Exception as e:
                 logger.log(f"Exception occurred while executing query: {e}", flag=1, name=method_name)
@@ -309,21 +745,39 @@ def execute_query(database:str, query:str, params:dict=None)->bool:
     except Exception as e:
         logger.log(f"Exception occurred while executing query: {e}", flag=1, name=method_name)
         return Exception(e)
-    
 
-def query_to_dataframe(database:str, query:str)->pd.DataFrame:
+async def execute_query_async(database:str, query:str, params:dict=None)->bool:
+    """
+    Execute SQL query through the database executor and return True if successful, False otherwise.
+    see execute_query for parameters.
+    """
+    method_name = __name__ + ".execute_query_async"
+    try:
+        await db_executor.run_connection(database, run_statement, query, params, commit=True)
+        invalidate_query_cache(database, query)
+        return True
+    except Exception as e:
+        logger.log(f"Exception occurred while executing query: {e}", flag=1, name=method_name)
+        return False
+
+def run_statement(connection, query:str, params:dict=None):
+    if params:
+        return connection.execute(text(query), params)
+    return connection.execute(text(query))
+
+def query_to_dataframe(database:str, query:str, params:dict=None)->pd.DataFrame:
     """
         execute sql query and return results in dataframe.
         - database: database name to connect
         - query: sql query to execute
-        - config_path: path to config.json
+        - params: parameters for the query (optional)
     """
     method_name = __name__ + ".query_to_dataframe"
     try:
-        engine = create_db_engine(database)
+        engine = engine_registry.get_engine(database)
         with engine.connect() as connection:
             try:
-                df = pd.read_sql(query, connection)
+                df = read_dataframe(connection, query, params)
             except Exception as e:
                 logger.log(f"Exception occurred while connecting: {e}", flag=1, name=method_name)
                 raise e
@@ -332,17 +786,116 @@ def query_to_dataframe(database:str, query:str)->pd.DataFrame:
         logger.log(f"Exception occurred while querying: {e}", flag=1, name=method_name)
         raise e
 
+async def query_to_dataframe_async(database:str, query:str, params:dict=None)->pd.DataFrame:
+    """
+        execute sql query through the database executor and return results in dataframe.
+        see query_to_dataframe for parameters.
+    """
+    method_name = __name__ + ".query_to_dataframe_async"
+    try:
+        if not db_executor.is_async:
+            return await db_executor.run_connection(database, read_dataframe, query, params)
+        # in async mode the callable runs on the event loop, so only rows are fetched there and the DataFrame is built in the threadpool
+        names, rows = await db_executor.run_connection(database, fetch_rows, query, params)
+        return await run_in_threadpool(rows_to_dataframe, names, rows)
+    except Exception as e:
+        logger.log(f"Exception occurred while querying: {e}", flag=1, name=method_name)
+        raise e
+
+def read_dataframe(connection, query:str, params:dict=None)->pd.DataFrame:
+    if params:
+        return pd.read_sql(text(query), connection, params=params)
+    return pd.read_sql(query, connection)
+
+def rows_to_dataframe(names:list, rows:list)->pd.DataFrame:
+    """build DataFrame of fetched rows the way pd.read_sql does."""
+    return pd.DataFrame.from_records(rows, columns=names, coerce_float=True)
+
+# Map table names to ORM models
+table_model_map = {
+    'job_information': JobInformation,
+    'industry_relation': IndustryRelation,
+    'industry': Industry,
+    'dev_stack': DevStack,
+    'job_stack': JobStack,
+    'category': Category,
+    'include_cartegory': IncludeCategory
+}
+
+def cached_job_information(session, database:str, pid_list:list, include:list=None)->dict:
+    """
+        return job information of given pids, loading only pids missing from the job cache in one batch.
+        - session: session of database to query
+        - database: database name, part of the cache key
+        - pid_list: pids of jobs to return
+        - include(optional): relations to load, see loaders.load_job_information
+    """
+    cache = get_job_cache()
+    if cache is None:
+        return load_job_information(session, pid_list, include)
+    include = list(DEFAULT_RELATIONS) if include is None else include
+    cache.invalidate_changed(database, session)
+    result, misses = cache.get_many(database, list(dict.fromkeys(pid_list)), include)
+    if misses:
+        loaded = load_job_information(session, misses, include)
+        cache.put_many(database, loaded, include)
+        result.update(loaded)
+    # keep the get_date descending order of uncached responses
+    ordered = sorted(result.items(), key=lambda item: (item[1]["get_date"] is not None, item[1]["get_date"] or datetime.min), reverse=True)
+    return dict(ordered)
+
+def search_pids_sql(session, search_keyword:str, cursor:str=None, limit:int=None)->list:
+    """
+        return pids matching given keyword through LIKE '%keyword%' over job fields, dev stacks, categories and industries.
+        - session: session of database to search
+        - search_keyword: keyword to search. if empty, every pid is returned.
+        - cursor, limit(optional): return at most limit pids greater than cursor, ordered by pid
+    """
+    return [row.pid for row in build_search_query(session, search_keyword, cursor, limit).all()]
+
+def build_search_query(session, search_keyword:str, cursor:str=None, limit:int=None):
+    """return query of pids matching given keyword, see search_pids_sql."""
+    columns = [JobInformation.pid, JobInformation.job_title, JobInformation.site_symbol,
+               JobInformation.crawl_url, JobInformation.crawl_domain, JobInformation.company_name]
+    if search_keyword:
+        pattern = f"%{search_keyword}%"
+        query1 = session.query(*columns).filter(
+            or_(
+                JobInformation.job_title.like(pattern),
+                JobInformation.site_symbol.like(pattern),
+                JobInformation.crawl_url.like(pattern),
+                JobInformation.crawl_domain.like(pattern),
+                JobInformation.company_name.like(pattern),
+            )
+        )
+        query2 = session.query(*columns).join(JobStack).join(DevStack).filter(DevStack.dev_stack.like(pattern))
+        query3 = session.query(*columns).join(IncludeCategory).join(Category).filter(Category.job_category.like(pattern))
+        query4 = session.query(*columns).join(IndustryRelation).join(Industry).filter(Industry.industry_type.like(pattern))
+        # Combine queries using union
+        combined_query = query1.union(query2).union(query3).union(query4)
+    else:
+        # Select all columns if no search keyword is provided
+        combined_query = session.query(*columns)
+    if cursor is None and limit is None:
+        return combined_query
+    # the first column of the union is the pid, whatever label the union gave it
+    pid_column = list(combined_query.subquery().c)[0]
+    paged_query = session.query(pid_column.label('pid')).order_by(pid_column)
+    if cursor is not None:
+        paged_query = paged_query.filter(pid_column > cursor)
+    if limit is not None:
+        paged_query = paged_query.limit(limit)
+    return paged_query
+
+async def get_table_schema(sessions:SessionScope, database:str, table_name:str):
+    """return schema of given table from the catalog, reflecting only that table the first time it is requested."""
+    schema = schema_catalog.get(database, table_name)
+    if schema is None:
+        built = await sessions.run_connection(database, schema_catalog.build, database, [table_name])
+        schema = built[table_name]
+    return schema
+
 def get_model_from_table(table_name: str):
-    # Map table names to ORM models
-    table_model_map = {
-        'job_information': JobInformation,
-        'industry_relation': IndustryRelation,
-        'industry': Industry,
-        'dev_stack': DevStack,
-        'job_stack': JobStack,
-        'category': Category,
-        'include_cartegory': IncludeCategory
-    }
     if table_name in table_model_map:
         return table_model_map[table_name]
     else:
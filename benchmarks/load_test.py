@@ -0,0 +1,268 @@
+"""
+    Drive every endpoint of app.py with concurrent clients against a seeded database and report latency percentiles,
+    throughput and memory per endpoint. Results can be stored as a baseline and later runs compared against it.
+
+    The app runs in this process through ASGI by default, configured by a temporary config.json pointing the benchmark
+    database at --url. With --server, requests go over HTTP to a running server whose config.json maps the database
+    "bench" to the seeded database through DATABASE_URLS.
+
+    usage:
+        pip install -r benchmarks/requirements.txt
+        python benchmarks/dataset.py sqlite:///benchmarks/data/jobs-10k.db --postings 10k --reset
+        python benchmarks/load_test.py --url sqlite:///benchmarks/data/jobs-10k.db --save-baseline sqlite-10k
+        python benchmarks/load_test.py --url sqlite:///benchmarks/data/jobs-10k.db --compare sqlite-10k
+"""
+import argparse, asyncio, json, os, platform, random, resource, sys, tempfile, time
+from datetime import datetime
+import httpx
+from sqlalchemy import create_engine, delete, select
+
+BENCHMARK_PATH = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCHMARK_PATH, "baselines")
+sys.path.insert(0, os.path.dirname(BENCHMARK_PATH))
+from model import JobInformation, DevStack
+from loaders import JOB_RELATIONS
+
+DATABASE = "bench"
+# drivers of the async engine per backend of --url
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "mysql": "aiomysql"}
+
+def sample_inputs(url:str, seed:int)->dict:
+    '''pick pids and keywords of the seeded database to build requests from.'''
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        # rows are read in a fixed order and sampled with the seeded rng, so a seed always picks the same pids
+        pids = connection.execute(select(JobInformation.pid).order_by(JobInformation.pid)).scalars().all()
+        stacks = connection.execute(select(DevStack.dev_stack).order_by(DevStack.dev_stack)).scalars().all()
+    engine.dispose()
+    rng = random.Random(seed)
+    pids = rng.sample(pids, min(500, len(pids)))
+    return {"pids": pids, "keywords": stacks + ["Engineer", "Senior", "Company 1"], "rng": rng}
+
+def scenarios(inputs:dict)->dict:
+    '''endpoint name -> (method, path, function returning request keyword arguments) covering every endpoint of app.py.'''
+    rng, pids, keywords = inputs["rng"], inputs["pids"], inputs["keywords"]
+    database = {"database": DATABASE}
+    pid_batch = lambda size: rng.sample(pids, min(size, len(pids)))
+    return {
+        "query_records": ("POST", "/query", lambda: {"json": dict(database, query=f"SELECT * FROM job_information WHERE site_symbol = '{rng.choice(['WA', 'SA', 'JK'])}' LIMIT 1000")}),
+        "query_paged": ("POST", "/query", lambda: {"json": dict(database, query="SELECT pid, job_title, get_date FROM job_information", key_column="pid", cursor=rng.choice(pids), limit=500)}),
+        "query_columns": ("POST", "/query", lambda: {"json": dict(database, query="SELECT pid, job_title, get_date FROM job_information LIMIT 5000", format="columns")}),
+        "query_arrow": ("POST", "/query", lambda: {"json": dict(database, query="SELECT pid, job_title, get_date FROM job_information LIMIT 5000", format="arrow")}),
+        "query_stream": ("POST", "/query", lambda: {"json": dict(database, query="SELECT pid, job_title FROM job_information", stream=True)}),
+        "unique_values": ("POST", "/unique_values", lambda: {"json": dict(database, table="job_information", **rng.choice([{"column": "site_symbol", "is_stacked": False}, {"column": "job_prefer", "is_stacked": True}]), top_n=50)}),
+        "columns": ("POST", "/columns", lambda: {"json": dict(database, table=rng.choice(["job_information", "job_stack", "dev_stack"]))}),
+        "row_count": ("POST", "/row_count", lambda: {"json": dict(database, query="SELECT COUNT(*) FROM job_information")}),
+        "table_row_count": ("POST", "/table_row_count", lambda: {"json": dict(database, table="job_information", filters={"site_symbol": rng.choice(["WA", "SA"])})}),
+        "stacked_columns": ("GET", "/stacked_columns", lambda: {"params": dict(database, table="job_information")}),
+        "dev_stacks": ("GET", "/dev_stacks", lambda: {"params": database}),
+        "facets": ("POST", "/facets", lambda: {"json": dict(database, search_keyword=rng.choice(keywords), top_n=20)}),
+        "search_keyword": ("GET", "/search_keyword", lambda: {"params": dict(database, search_keyword=rng.choice(keywords))}),
+        "search_keyword_paged": ("GET", "/search_keyword", lambda: {"params": dict(database, search_keyword=rng.choice(keywords), limit=100)}),
+        "search": ("POST", "/search", lambda: {"json": dict(database, keyword=rng.choice(keywords), dev_stacks=rng.sample(keywords, 2), with_facets=True)}),
+        "job_information_get": ("GET", "/job_information", lambda: {"params": dict(database, pid=pid_batch(20))}),
+        "job_information_post": ("POST", "/job_information", lambda: {"json": dict(database, pid_list=pid_batch(200), include=["dev_stacks", "categories", "industries"])}),
+        "ingest": ("POST", "/ingest", lambda: {"json": dict(database, postings=synthetic_postings(rng, 100))}),
+        "search_index_check": ("GET", "/search_index/check", lambda: {"params": dict(database, keywords=rng.sample(keywords, 3))}),
+        "search_index_rebuild": ("POST", "/search_index/rebuild", lambda: {"json": database}),
+        "schema_catalog_refresh": ("POST", "/schema_catalog/refresh", lambda: {"json": database}),
+        "job_cache_stats": ("GET", "/job_cache/stats", lambda: {}),
+        "query_cache_stats": ("GET", "/query_cache/stats", lambda: {}),
+        "pool_stats": ("GET", "/pool_stats", lambda: {}),
+        "metrics": ("GET", "/metrics", lambda: {}),
+    }
+
+def synthetic_postings(rng, count:int)->list:
+    '''return postings for /ingest. their pids start with LT, so rows written by load tests are told apart from seeded ones.'''
+    return [{
+        "pid": f"LT{rng.randrange(10**9):09d}",
+        "job_title": "Load Test Engineer",
+        "site_symbol": "LT",
+        "company_name": "Load Test",
+        "dev_stacks": rng.sample(["Python", "Go", "Kafka", "Redis"], 2),
+        "categories": ["Backend"],
+        "industries": ["Commerce"],
+    } for _ in range(count)]
+
+def stored_terms(url:str)->dict:
+    '''return ids of dev stacks, categories and industries stored in the seeded database, per relation.'''
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        terms = {relation: set(connection.execute(select(getattr(term, term_id))).scalars()) for relation, (_, term, term_id, _) in JOB_RELATIONS.items()}
+    engine.dispose()
+    return terms
+
+def remove_load_test_rows(url:str, terms:dict):
+    '''delete postings written by the ingest scenario with their links, and terms created since given stored_terms, so runs stay reproducible.'''
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        for link, term, term_id, _ in JOB_RELATIONS.values():
+            connection.execute(delete(link).where(link.pid.like("LT%")))
+        connection.execute(delete(JobInformation).where(JobInformation.pid.like("LT%")))
+        for relation, (_, term, term_id, _) in JOB_RELATIONS.items():
+            created = set(connection.execute(select(getattr(term, term_id))).scalars()) - terms[relation]
+            if created:
+                connection.execute(delete(term).where(getattr(term, term_id).in_(created)))
+    engine.dispose()
+
+# maintenance endpoints rebuild whole structures, so they get fewer requests
+LIGHT_SCENARIOS = {"ingest": 0.1, "search_index_check": 0.1, "search_index_rebuild": 0.02, "schema_catalog_refresh": 0.05, "dev_stacks": 0.2, "query_stream": 0.2}
+
+def rss_mb()->float:
+    '''return resident memory of this process in megabytes.'''
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(values:list, fraction:float)->float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run_scenario(client, method:str, path:str, build, requests:int, concurrency:int)->dict:
+    '''send given number of requests with at most concurrency in flight and return latency, throughput and error statistics.'''
+    latencies, errors, received = [], 0, 0
+    semaphore = asyncio.Semaphore(concurrency)
+    async def one():
+        nonlocal errors, received
+        kwargs = build()
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                received += len(response.content)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(requests)])
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "bytes_per_request": round(received / requests) if requests else 0,
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+async def run(args)->dict:
+    inputs = sample_inputs(args.url, args.seed)
+    selected = scenarios(inputs)
+    if args.endpoints:
+        selected = {name: scenario for name, scenario in selected.items() if name in args.endpoints}
+    results = {}
+    async def drive(client):
+        for name, (method, path, build) in selected.items():
+            requests = max(1, int(args.requests * LIGHT_SCENARIOS.get(name, 1.0)))
+            # one untimed request fills caches and lazily built structures, as in a warmed up worker
+            await client.request(method, path, **build())
+            results[name] = await run_scenario(client, method, path, build, requests, args.concurrency)
+            print_row(name, results[name])
+    print_header()
+    if args.server:
+        async with httpx.AsyncClient(base_url=args.server, timeout=args.timeout) as client:
+            await drive(client)
+    else:
+        import app
+        async with app.app.router.lifespan_context(app.app):
+            transport = httpx.ASGITransport(app=app.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=args.timeout) as client:
+                await drive(client)
+    return results
+
+def write_config(args)->str:
+    '''write config.json of the in-process app, pointing the benchmark database at --url, and return its path.'''
+    backend = args.url.split(":", 1)[0].split("+", 1)[0]
+    config = {
+        "DATABASE_URLS": {DATABASE: args.url},
+        "WARMUP_DATABASES": [DATABASE],
+        "DB_MODE": args.db_mode,
+        "ASYNC_DRIVER": ASYNC_DRIVERS.get(backend, "aiomysql"),
+        "POOL_SIZE": args.concurrency,
+        "LOG_LEVEL": "WARN",
+    }
+    config.update(json.loads(args.config) if args.config else {})
+    handle, path = tempfile.mkstemp(prefix="tmi-benchmark-", suffix=".json")
+    with os.fdopen(handle, "w") as f:
+        json.dump(config, f)
+    return path
+
+def print_header():
+    print(f"{'endpoint':<24}{'requests':>9}{'errors':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'bytes':>11}{'rss MB':>9}")
+
+def print_row(name:str, result:dict):
+    print(f"{name:<24}{result['requests']:>9}{result['errors']:>7}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+          f"{result['throughput_rps']:>10.1f}{result['bytes_per_request']:>11,}{result['rss_mb']:>9.1f}")
+
+def compare(results:dict, baseline:dict, threshold:float)->list:
+    '''return descriptions of endpoints whose p95 latency or throughput regressed beyond threshold against baseline.'''
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        p95_change = result["p95_ms"] / previous["p95_ms"] - 1 if previous["p95_ms"] else 0.0
+        throughput_change = result["throughput_rps"] / previous["throughput_rps"] - 1 if previous["throughput_rps"] else 0.0
+        flag = p95_change > threshold or throughput_change < -threshold or result["errors"] > previous["errors"]
+        print(f"{name:<24} p95 {previous['p95_ms']:>9.1f} -> {result['p95_ms']:>9.1f} ms ({p95_change:+.0%})"
+              f"  throughput {previous['throughput_rps']:>8.1f} -> {result['throughput_rps']:>8.1f} req/s ({throughput_change:+.0%}){'  REGRESSION' if flag else ''}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="URL of the seeded database, see benchmarks/dataset.py")
+    parser.add_argument("--server", help="base URL of a running server to benchmark instead of the in-process app")
+    parser.add_argument("--db-mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--config", help="JSON object of extra config.json keys for the in-process app")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--endpoints", nargs="*", help="names of endpoints to run, defaults to every endpoint")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--save-baseline", metavar="NAME", help=f"store results as {BASELINE_PATH}/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare results against a stored baseline, exiting with 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative change of p95 or throughput counted as regression")
+    args = parser.parse_args()
+    if not args.server:
+        os.environ["TMI_CONFIG_PATH"] = write_config(args)
+    terms = stored_terms(args.url)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        remove_load_test_rows(args.url, terms)
+        if not args.server:
+            os.remove(os.environ["TMI_CONFIG_PATH"])
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "url": args.url.split("@")[-1],
+        "db_mode": args.db_mode,
+        "concurrency": args.concurrency,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    print(f"peak rss {report['peak_rss_mb']} MB")
+    if args.save_baseline:
+        os.makedirs(BASELINE_PATH, exist_ok=True)
+        with open(os.path.join(BASELINE_PATH, f"{args.save_baseline}.json"), "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(os.path.join(BASELINE_PATH, f"{args.compare}.json")) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"regressions: {regressions}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+    Compare /query response formats on synthetic job rows held in an in-memory SQLite database.
+    For each format, report time to build the response body from the query result and its size in bytes.
+    records is the default path of /query: pd.read_sql, astype(object).to_dict and FastAPI JSON encoding.
+
+    usage: python benchmarks/query_formats.py [--rows 50000] [--repeat 5]
+"""
+import argparse, os, sys, time
+from datetime import datetime, timedelta
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from formats import available_formats, fetch_columns, encode_columns
+
+QUERY = "SELECT * FROM job_information"
+
+def seed(engine, rows:int):
+    start = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE job_information (pid TEXT PRIMARY KEY, job_title TEXT, site_symbol TEXT, job_prefer TEXT, crawl_url TEXT, "
+            "start_date TIMESTAMP, end_date TIMESTAMP, get_date TIMESTAMP, required_career TEXT, company_name TEXT)"
+        )
+        connection.execute(text(
+            "INSERT INTO job_information VALUES (:pid, :job_title, :site_symbol, :job_prefer, :crawl_url, :start_date, :end_date, :get_date, :required_career, :company_name)"
+        ), [{
+            "pid": f"p{i:08d}",
+            "job_title": f"Backend engineer {i % 977}",
+            "site_symbol": ("WA", "SA", "JK", "RM")[i % 4],
+            "job_prefer": "['python', 'aws', 'kubernetes']",
+            "crawl_url": f"https://example.com/jobs/{i}",
+            "start_date": start + timedelta(minutes=i),
+            "end_date": start + timedelta(days=30, minutes=i),
+            "get_date": start + timedelta(minutes=i),
+            "required_career": str(i % 2),
+            "company_name": f"company {i % 4211}",
+        } for i in range(rows)])
+
+def records_body(connection)->bytes:
+    df = pd.read_sql(QUERY, connection)
+    return JSONResponse(jsonable_encoder(df.astype(object).to_dict(orient='records'))).body
+
+def columnar_body(connection, format:str)->bytes:
+    names, columns = fetch_columns(connection, QUERY)
+    return encode_columns(names, columns, format)
+
+def measure(fn, repeat:int):
+    timings, body = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), sorted(timings)[len(timings) // 2], len(body)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    engine = create_engine("sqlite://")
+    seed(engine, args.rows)
+    print(f"{args.rows} rows, best/median of {args.repeat} runs, query and encoding included")
+    print(f"{'format':<10}{'best ms':>12}{'median ms':>12}{'bytes':>14}")
+    with engine.connect() as connection:
+        cases = [("records", lambda: records_body(connection))]
+        cases += [(format, lambda format=format: columnar_body(connection, format)) for format in available_formats() if format != "records"]
+        for name, fn in cases:
+            best, median, size = measure(fn, args.repeat)
+            print(f"{name:<10}{best * 1000:>12.1f}{median * 1000:>12.1f}{size:>14,}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+    Compare JSON encoding and compression of typical payloads of /search_keyword, /job_information and /query.
+    For each payload, report encode time of FastAPI's default path (jsonable_encoder and JSONResponse) against
+    serialization.dumps, and body size uncompressed, with gzip and with zstd, along with compression time.
+
+    usage: python benchmarks/serialization.py [--jobs 5000] [--repeat 5]
+"""
+import argparse, os, sys, time
+from datetime import datetime, timedelta
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from serialization import dumps, available_encodings, Compressor, COMPRESSION_DEFAULTS
+
+def payloads(jobs:int)->dict:
+    start = datetime(2024, 1, 1)
+    pids = [f"p{i:08d}" for i in range(jobs * 10)]
+    job_information = {
+        f"p{i:08d}": {
+            "job_title": f"Backend engineer {i % 977}",
+            "company_name": f"company {i % 4211}",
+            "dev_stacks": ["Python", "AWS", "Kubernetes"][: 1 + i % 3],
+            "job_prefer": ["pref a", "pref b"],
+            "required_career": str(i % 2),
+            "resume_required": "1",
+            "start_date": start + timedelta(minutes=i),
+            "end_date": start + timedelta(days=30, minutes=i),
+            "crawl_url": f"https://example.com/jobs/{i}",
+            "get_date": start + timedelta(minutes=i),
+        }
+        for i in range(jobs)
+    }
+    frame = pd.DataFrame([dict(job, pid=pid, dev_stacks=None, job_prefer="['pref a', 'pref b']") for pid, job in job_information.items()])
+    return {
+        "/search_keyword": {"result": pids},
+        "/job_information": job_information,
+        "/query": frame.astype(object).to_dict(orient='records'),
+    }
+
+def measure(fn, repeat:int):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2], result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(f"median of {args.repeat} runs, {args.jobs} jobs ({args.jobs * 10} pids)")
+    print(f"{'endpoint':<18}{'default ms':>12}{'dumps ms':>10}{'bytes':>12}" + "".join(f"{encoding + ' bytes':>14}{encoding + ' ms':>10}" for encoding in available_encodings()))
+    for endpoint, content in payloads(args.jobs).items():
+        default_time, _ = measure(lambda: JSONResponse(jsonable_encoder(content)).body, args.repeat)
+        dumps_time, body = measure(lambda: dumps(content), args.repeat)
+        line = f"{endpoint:<18}{default_time * 1000:>12.1f}{dumps_time * 1000:>10.1f}{len(body):>12,}"
+        for encoding in available_encodings():
+            compress_time, compressed = measure(lambda: Compressor(encoding, COMPRESSION_DEFAULTS).finish(body), args.repeat)
+            line += f"{len(compressed):>14,}{compress_time * 1000:>10.1f}"
+        print(line)
+
+if __name__ == "__main__":
+    main()
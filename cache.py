@@ -0,0 +1,243 @@
+import time, pickle, sqlite3, threading
+from collections import OrderedDict
+from model import JobInformation
+from utils import Logger
+
+logger = Logger()
+
+class TTLCache():
+    '''
+        Thread-safe in-memory cache with least-recently-used eviction and per-entry expiry.
+        - max_entries: number of entries kept before the least recently used one is evicted
+        - ttl: default seconds an entry stays valid
+    '''
+    def __init__(self, max_entries:int=10000, ttl:float=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.counters["expirations"] += 1
+                self.counters["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return value
+
+    def put(self, key, value, ttl:float=None, expires_at:float=None):
+        '''store value under key, expiring after ttl seconds or at given wall clock time.'''
+        if expires_at is None:
+            expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.counters["invalidations"] += 1
+            return entry[0] if entry is not None else None
+
+    def items(self)->list:
+        '''return snapshot of (key, value) pairs of unexpired entries without touching their recency.'''
+        now = time.time()
+        with self._lock:
+            return [(key, value) for key, (value, expires_at) in self._entries.items() if expires_at > now]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self)->dict:
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), max_entries=self.max_entries)
+
+class DiskCacheTier():
+    '''
+        SQLite backed cache tier shared by every worker on the host. placing the file under /dev/shm keeps it in shared memory.
+        - path: location of the cache file
+        - max_entries: number of entries kept before the ones expiring first are dropped
+    '''
+    def __init__(self, path:str, max_entries:int=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        connection = self._connection()
+        connection.execute("CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)")
+        connection.commit()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys:list)->dict:
+        '''return dictionary of key -> (value, expires_at) for unexpired keys found in the tier.'''
+        found = {}
+        now = time.time()
+        connection = self._connection()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start+500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(f"SELECT key, value, expires_at FROM cache_entries WHERE key IN ({placeholders}) AND expires_at > ?", (*chunk, now))
+            for key, value, expires_at in rows:
+                found[key] = (pickle.loads(value), expires_at)
+        return found
+
+    def put_many(self, items:list):
+        '''store list of (key, value, expires_at).'''
+        if not items:
+            return
+        connection = self._connection()
+        connection.executemany(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+            [(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), expires_at) for key, value, expires_at in items],
+        )
+        self._writes += len(items)
+        if self._writes >= self.max_entries // 10:
+            self._writes = 0
+            self.prune()
+
+    def delete_many(self, keys:list):
+        connection = self._connection()
+        connection.executemany("DELETE FROM cache_entries WHERE key = ?", [(key,) for key in keys])
+
+    def prune(self):
+        '''drop expired entries and the ones expiring first beyond max_entries.'''
+        connection = self._connection()
+        connection.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+        connection.execute(
+            "DELETE FROM cache_entries WHERE key IN (SELECT key FROM cache_entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+class JobCache():
+    '''
+        Cache of /job_information entries keyed by (database, pid), with an optional disk tier shared across workers.
+        Entries remember the get_date and end_date they were built from and are dropped once either changes in the database.
+        - max_entries, ttl: bounds of the in-memory tier
+        - path(optional): location of the shared disk tier. if not set, only memory is used.
+        - check_interval: seconds between checks of cached entries against get_date and end_date in the database
+    '''
+    def __init__(self, max_entries:int=10000, ttl:float=300, path:str=None, check_interval:float=30):
+        self.memory = TTLCache(max_entries, ttl)
+        self.disk = DiskCacheTier(path, max_entries * 10) if path else None
+        self.check_interval = check_interval
+        self.counters = {"disk_hits": 0, "stale": 0}
+        self._checked_at = {}
+        self._check_lock = threading.Lock()
+
+    @staticmethod
+    def disk_key(database:str, pid:str)->str:
+        return f"{database}\x00{pid}"
+
+    def get_many(self, database:str, pid_list:list, include:list):
+        '''
+            Look up given pids, first in memory and then in the disk tier.
+            return dictionary of pid -> cached job data holding the requested relations, and list of missing pids.
+        '''
+        method_name = __name__ + ".get_many"
+        hits, misses = {}, []
+        for pid in pid_list:
+            entry = self.memory.get((database, pid))
+            if entry is not None and set(include) <= entry["include"]:
+                hits[pid] = entry
+            else:
+                misses.append(pid)
+        if self.disk is not None and misses:
+            try:
+                found = self.disk.get_many([self.disk_key(database, pid) for pid in misses])
+            except Exception as e:
+                logger.log(f"Exception occurred while reading disk cache: {e}", flag=1, name=method_name)
+                found = {}
+            remaining = []
+            for pid in misses:
+                item = found.get(self.disk_key(database, pid))
+                if item is not None and set(include) <= item[0]["include"]:
+                    entry, expires_at = item
+                    self.memory.put((database, pid), entry, expires_at=expires_at)
+                    hits[pid] = entry
+                    self.counters["disk_hits"] += 1
+                else:
+                    remaining.append(pid)
+            misses = remaining
+        return {pid: self._project(entry, include) for pid, entry in hits.items()}, misses
+
+    def put_many(self, database:str, jobs:dict, include:list):
+        '''store loaded job data of given database, remembering which relations it holds.'''
+        method_name = __name__ + ".put_many"
+        expires_at = time.time() + self.memory.ttl
+        items = []
+        for pid, job_data in jobs.items():
+            entry = {"job": job_data, "include": frozenset(include), "version": (job_data.get("get_date"), job_data.get("end_date"))}
+            self.memory.put((database, pid), entry, expires_at=expires_at)
+            items.append((self.disk_key(database, pid), entry, expires_at))
+        if self.disk is not None:
+            try:
+                self.disk.put_many(items)
+            except Exception as e:
+                logger.log(f"Exception occurred while writing disk cache: {e}", flag=1, name=method_name)
+
+    def invalidate(self, database:str, pid_list:list):
+        for pid in pid_list:
+            self.memory.pop((database, pid))
+        if self.disk is not None and pid_list:
+            self.disk.delete_many([self.disk_key(database, pid) for pid in pid_list])
+
+    def invalidate_changed(self, database:str, session, force:bool=False)->int:
+        '''
+            Drop cached entries of given database whose get_date or end_date differs from the database.
+            runs at most once per check_interval unless forced. return number of invalidated entries.
+        '''
+        now = time.monotonic()
+        if not force and now - self._checked_at.get(database, 0) < self.check_interval:
+            return 0
+        if not self._check_lock.acquire(blocking=force):
+            return 0
+        try:
+            self._checked_at[database] = now
+            cached = {key[1]: entry["version"] for key, entry in self.memory.items() if key[0] == database}
+            pids = list(cached.keys())
+            current = {}
+            for start in range(0, len(pids), 1000):
+                chunk = pids[start:start+1000]
+                rows = session.query(JobInformation.pid, JobInformation.get_date, JobInformation.end_date).filter(JobInformation.pid.in_(chunk))
+                current.update({pid: (get_date, end_date) for pid, get_date, end_date in rows})
+            stale = [pid for pid, version in cached.items() if current.get(pid) != version]
+            self.invalidate(database, stale)
+            self.counters["stale"] += len(stale)
+            return len(stale)
+        finally:
+            self._check_lock.release()
+
+    def stats(self)->dict:
+        stats = self.memory.stats()
+        stats.update(self.counters)
+        stats["disk"] = self.disk.path if self.disk is not None else None
+        return stats
+
+    @staticmethod
+    def _project(entry:dict, include:list)->dict:
+        '''return copy of cached job data without relations that were not requested.'''
+        job_data = dict(entry["job"])
+        for relation in entry["include"] - set(include):
+            job_data.pop(relation, None)
+        return job_data
@@ -0,0 +1,80 @@
+import threading, time
+from sqlalchemy import MetaData, select
+from model import Base
+from utils import Logger
+
+logger = Logger()
+
+# rows sampled per table to detect columns holding stringified lists
+STACKED_SAMPLE_SIZE = 100
+
+class TableSchema():
+    '''
+        Column names of one table and the columns holding stringified lists such as "['python', 'java']".
+        - model: ORM model of the table in model.py, None for tables only found by reflection
+    '''
+    def __init__(self, name:str, columns:list, stacked_columns:list, model=None):
+        self.name = name
+        self.columns = columns
+        self.stacked_columns = stacked_columns
+        self.model = model
+
+class SchemaCatalog():
+    '''
+        Columns and stacked columns of every table per database, built from model.py and one reflection pass,
+        so /columns and /stacked_columns are answered from memory. The catalog is kept until explicitly refreshed.
+    '''
+    def __init__(self):
+        self._tables = {}
+        self._built_at = {}
+        self._lock = threading.Lock()
+
+    def build(self, connection, database:str, tables:list=None)->dict:
+        '''
+            Reflect tables of given database and sample their rows once to detect stacked columns.
+            - connection: connection of database to reflect through
+            - tables(optional): names of tables to (re)build. if not set, every table of the database is rebuilt.
+            return dictionary of table name -> TableSchema of built tables.
+        '''
+        method_name = __name__ + ".build"
+        start = time.perf_counter()
+        metadata = MetaData()
+        metadata.reflect(bind=connection, only=tables)
+        models = {mapper.class_.__tablename__: mapper.class_ for mapper in Base.registry.mappers}
+        built = {}
+        for name, table in metadata.tables.items():
+            columns = [column.name for column in table.columns]
+            built[name] = TableSchema(name, columns, self._sample_stacked(connection, table), models.get(name))
+        with self._lock:
+            current = {} if tables is None else dict(self._tables.get(database, {}))
+            current.update(built)
+            self._tables[database] = current
+            self._built_at[database] = time.time()
+        logger.log(f"built schema catalog of {database} with {len(built)} tables in {time.perf_counter() - start:.3f}s", flag=3, name=method_name)
+        return built
+
+    def get(self, database:str, table_name:str)->TableSchema:
+        '''return cached schema of given table, or None if it is not built yet.'''
+        return self._tables.get(database, {}).get(table_name)
+
+    def tables(self, database:str)->list:
+        return list(self._tables.get(database, {}).keys())
+
+    def stats(self)->dict:
+        return {database: {"tables": len(tables), "built_at": self._built_at.get(database)} for database, tables in self._tables.items()}
+
+    @staticmethod
+    def _sample_stacked(connection, table)->list:
+        '''return columns whose first non-null value among sampled rows is a stringified list.'''
+        method_name = __name__ + ".sample_stacked"
+        try:
+            rows = connection.execute(select(*table.columns).limit(STACKED_SAMPLE_SIZE)).all()
+        except Exception as e:
+            logger.log(f"Exception occurred while sampling {table.name}: {e}", flag=1, name=method_name)
+            return []
+        stacked = []
+        for index, column in enumerate(table.columns):
+            value = next((row[index] for row in rows if row[index] is not None), None)
+            if isinstance(value, str) and value.startswith('['):
+                stacked.append(column.name)
+        return stacked
@@ -0,0 +1,76 @@
+import os, json, threading, time
+from utils import Logger
+
+logger = Logger()
+
+class ConfigStore():
+    '''
+        Cached loader of config.json. The file is parsed once and reloaded only when its modification time changes.
+        - path: location of config.json
+        - check_interval(optional): minimum seconds between modification checks on access
+    '''
+    def __init__(self, path:str, check_interval:float=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._config = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def get(self)->dict:
+        '''return cached configuration, reloading it if the file has changed since the last check.'''
+        if self._config is None or time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload_if_changed()
+        return self._config
+
+    def __call__(self)->dict:
+        return self.get()
+
+    def reload_if_changed(self)->bool:
+        '''reload configuration when the modification time of the file differs. return True if reloaded.'''
+        method_name = __name__ + ".reload_if_changed"
+        with self._lock:
+            self._checked_at = time.monotonic()
+            mtime = os.stat(self.path).st_mtime
+            if self._config is not None and mtime == self._mtime:
+                return False
+            with open(self.path, 'r') as f:
+                config = json.load(f)
+            previous = self._config
+            self._config = config
+            self._mtime = mtime
+        if previous is not None:
+            logger.log(f"configuration reloaded from {self.path}", flag=3, name=method_name)
+            for listener in self._listeners:
+                try:
+                    listener(previous, config)
+                except Exception as e:
+                    logger.log(f"Exception occurred while notifying configuration change: {e}", flag=1, name=method_name)
+        return True
+
+    def on_change(self, listener):
+        '''register callable receiving (previous, current) configuration whenever the file is reloaded.'''
+        self._listeners.append(listener)
+
+    def start_watching(self, interval:float=None):
+        '''poll the file on a daemon thread so changes are applied without waiting for the next access.'''
+        if self._watcher is not None:
+            return
+        interval = interval or self.check_interval
+        self._stop.clear()
+        def watch():
+            method_name = __name__ + ".watch"
+            while not self._stop.wait(interval):
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    logger.log(f"Exception occurred while watching configuration: {e}", flag=1, name=method_name)
+        self._watcher = threading.Thread(target=watch, name="config-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        self._watcher = None
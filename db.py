@@ -0,0 +1,368 @@
+import asyncio, threading, time
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.concurrency import run_in_threadpool
+from utils import Logger
+
+logger = Logger()
+
+# default pool settings, overridable through config.json
+POOL_DEFAULTS = {
+    "POOL_SIZE": 5,
+    "MAX_OVERFLOW": 10,
+    "POOL_TIMEOUT": 30,
+    "POOL_RECYCLE": 3600,
+    "POOL_PRE_PING": True,
+}
+# configuration keys that require engines to be rebuilt when changed
+ENGINE_CONFIG_KEYS = ["USER", "PASSWORD", "ENDPOINT", "PORT", "DATABASE_URLS", "DB_MODE", "ASYNC_DRIVER"] + list(POOL_DEFAULTS.keys())
+DEFAULT_ASYNC_DRIVER = "aiomysql"
+
+class TimedQueuePool(QueuePool):
+    '''
+        QueuePool which records how long each checkout waited for a free connection.
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = {"checkouts": 0, "waits": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "timeouts": 0}
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        # a checkout waits only when the pool and its overflow are exhausted
+        must_wait = self.checkedout() >= self.size() + max(self._max_overflow, 0)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._stats_lock:
+                self.stats["timeouts"] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.stats["checkouts"] += 1
+                if must_wait:
+                    self.stats["waits"] += 1
+                    self.stats["wait_seconds"] += elapsed
+                self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], elapsed)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        pool._stats_lock = self._stats_lock
+        return pool
+
+class EngineRegistry():
+    '''
+        Process-wide registry of SQLAlchemy engines, one per database.
+        Engines and their connection pools are created lazily on first use and reused by every request of the worker.
+        - config_loader: callable returning the configuration dictionary (connection and pool settings)
+    '''
+    def __init__(self, config_loader):
+        self.config_loader = config_loader
+        self._engines = {}
+        self._session_factories = {}
+        self._lock = threading.Lock()
+
+    def get_engine(self, database:str):
+        '''return engine of given database, creating it once per process.'''
+        engine = self._engines.get(database)
+        if engine is not None:
+            return engine
+        with self._lock:
+            engine = self._engines.get(database)
+            if engine is None:
+                engine = create_db_engine(database, self.config_loader())
+                self._engines[database] = engine
+                self._session_factories[database] = sessionmaker(bind=engine)
+        return engine
+
+    def get_session_factory(self, database:str):
+        '''return sessionmaker bound to the engine of given database.'''
+        self.get_engine(database)
+        return self._session_factories[database]
+
+    def warmup(self, database:str, connections:int=None):
+        '''
+            Create engine of given database and fill its pool before serving requests.
+            - connections(optional): number of connections to open. if not set, pool size is used.
+        '''
+        engine = self.get_engine(database)
+        connections = connections if connections is not None else engine.pool.size()
+        opened = []
+        try:
+            for _ in range(connections):
+                opened.append(engine.connect())
+        finally:
+            for connection in opened:
+                connection.close()
+
+    def dispose(self, database:str=None):
+        '''
+            Dispose engines and close their pooled connections.
+            - database(optional): database to dispose. if not set, every engine is disposed.
+        '''
+        with self._lock:
+            targets = [database] if database else list(self._engines.keys())
+            for name in targets:
+                engine = self._engines.pop(name, None)
+                self._session_factories.pop(name, None)
+                if engine is not None:
+                    engine.dispose()
+
+    def pool_stats(self)->dict:
+        '''return checkout and wait statistics of every pool in the registry.'''
+        stats = {}
+        for name, engine in list(self._engines.items()):
+            pool = engine.pool
+            pool_stats = {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            }
+            pool_stats.update(getattr(pool, "stats", {}))
+            stats[name] = pool_stats
+        return stats
+
+class AsyncEngineRegistry():
+    '''
+        Process-wide registry of SQLAlchemy asyncio engines, one per database, used when DB_MODE is "async".
+        - config_loader: callable returning the configuration dictionary (connection and pool settings)
+    '''
+    def __init__(self, config_loader):
+        self.config_loader = config_loader
+        self._engines = {}
+        self._session_factories = {}
+        self._retired = []
+
+    def get_engine(self, database:str):
+        '''return async engine of given database, creating it once per process.'''
+        engine = self._engines.get(database)
+        if engine is None:
+            # engines are only created from the event loop thread, so no lock is needed
+            engine = create_async_db_engine(database, self.config_loader())
+            self._engines[database] = engine
+        return engine
+
+    def get_session_factory(self, database:str):
+        factory = self._session_factories.get(database)
+        if factory is None:
+            factory = self._session_factories[database] = async_sessionmaker(bind=self.get_engine(database))
+        return factory
+
+    async def warmup(self, database:str, connections:int=None):
+        '''open given number of connections at once so the async pool is filled before serving requests.'''
+        engine = self.get_engine(database)
+        connections = connections if connections is not None else engine.pool.size()
+        opened = [await engine.connect() for _ in range(connections)]
+        for connection in opened:
+            await connection.close()
+
+    def retire(self):
+        '''stop handing out current engines. they are disposed by the next call of dispose.'''
+        self._retired.extend(self._engines.values())
+        self._engines, self._session_factories = {}, {}
+
+    async def dispose(self, database:str=None):
+        targets = [database] if database else list(self._engines.keys())
+        retired, self._retired = self._retired, []
+        for name in targets:
+            self._session_factories.pop(name, None)
+            retired.append(self._engines.pop(name, None))
+        for engine in retired:
+            if engine is not None:
+                await engine.dispose()
+
+    def pool_stats(self)->dict:
+        stats = {}
+        for name, engine in list(self._engines.items()):
+            pool = engine.pool
+            stats[name] = {"size": pool.size(), "checked_in": pool.checkedin(), "checked_out": pool.checkedout(), "overflow": pool.overflow()}
+        return stats
+
+class DatabaseExecutor():
+    '''
+        Runs database work of the async request handlers, either on the threadpool with the sync engines
+        or on the event loop with the asyncio engines, as chosen by DB_MODE ("sync" or "async") in config.json.
+        Database work written against sync sessions and connections runs unchanged in both modes,
+        through run_sync of the asyncio extension in async mode. Python-heavy work runs on the threadpool in both modes,
+        see SessionScope.run_threaded.
+        Work in flight is bounded per database by DB_MAX_CONCURRENCY, defaulting to pool size plus overflow.
+    '''
+    def __init__(self, registry:EngineRegistry, config_loader):
+        self.registry = registry
+        self.async_registry = AsyncEngineRegistry(config_loader)
+        self.config_loader = config_loader
+        self._limiters = {}
+        self.loop = None
+
+    @property
+    def is_async(self)->bool:
+        return self.config_loader().get("DB_MODE", "sync") == "async"
+
+    def limiter(self, database:str)->asyncio.Semaphore:
+        '''return semaphore bounding concurrent database work of given database.'''
+        limiter = self._limiters.get(database)
+        if limiter is None:
+            config = self.config_loader()
+            default = config.get("POOL_SIZE", POOL_DEFAULTS["POOL_SIZE"]) + config.get("MAX_OVERFLOW", POOL_DEFAULTS["MAX_OVERFLOW"])
+            limiter = self._limiters[database] = asyncio.Semaphore(config.get("DB_MAX_CONCURRENCY", default))
+        return limiter
+
+    async def run_connection(self, database:str, fn, *args, commit:bool=False, **kwargs):
+        '''
+            Run fn(connection, *args, **kwargs) with a pooled connection of given database and return its result.
+            - commit(optional): commit the transaction after fn returns
+        '''
+        async with self.limiter(database):
+            if self.is_async:
+                async with self.async_registry.get_engine(database).connect() as connection:
+                    result = await connection.run_sync(fn, *args, **kwargs)
+                    if commit:
+                        await connection.commit()
+                    return result
+            return await run_in_threadpool(self._run_sync_connection, database, fn, args, kwargs, commit)
+
+    def _run_sync_connection(self, database:str, fn, args, kwargs, commit:bool):
+        with self.registry.get_engine(database).connect() as connection:
+            result = fn(connection, *args, **kwargs)
+            if commit:
+                connection.commit()
+            return result
+
+    def streaming_engine(self, database:str):
+        '''return engine used to stream results of given database, async or sync according to DB_MODE.'''
+        if self.is_async:
+            return self.async_registry.get_engine(database)
+        return self.registry.get_engine(database)
+
+    def on_config_change(self, previous:dict, current:dict):
+        '''rebuild engines and limiters with new settings. async engines are disposed on the event loop.'''
+        changed = [key for key in ENGINE_CONFIG_KEYS + ["DB_MAX_CONCURRENCY"] if previous.get(key) != current.get(key)]
+        if not changed:
+            return
+        self._limiters = {}
+        self.registry.dispose()
+        self.async_registry.retire()
+        if self.loop is not None and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.async_registry.dispose(), self.loop)
+
+    async def dispose(self):
+        '''dispose sync and async engines of this worker.'''
+        await run_in_threadpool(self.registry.dispose)
+        await self.async_registry.dispose()
+
+    def pool_stats(self)->dict:
+        stats = self.registry.pool_stats()
+        for name, pool_stats in self.async_registry.pool_stats().items():
+            stats[f"{name} (async)"] = pool_stats
+        return stats
+
+class SessionScope():
+    '''
+        Request-scoped holder of ORM sessions. Sessions are opened lazily per database and closed when the request ends.
+    '''
+    def __init__(self, executor:DatabaseExecutor):
+        self.executor = executor
+        self.registry = executor.registry
+        self._sessions = {}
+        self._async_sessions = {}
+
+    def get(self, database:str):
+        '''return sync session of given database, opened once per request.'''
+        session = self._sessions.get(database)
+        if session is None:
+            session = self.registry.get_session_factory(database)()
+            self._sessions[database] = session
+        return session
+
+    async def run(self, database:str, fn, *args, **kwargs):
+        '''
+            Run fn(session, *args, **kwargs) with the session of given database and return its result.
+            in async mode the session is an AsyncSession and fn receives its sync facade through run_sync.
+        '''
+        async with self.executor.limiter(database):
+            if self.executor.is_async:
+                session = self._async_sessions.get(database)
+                if session is None:
+                    session = self._async_sessions[database] = self.executor.async_registry.get_session_factory(database)()
+                return await session.run_sync(fn, *args, **kwargs)
+            return await run_in_threadpool(fn, self.get(database), *args, **kwargs)
+
+    async def run_threaded(self, database:str, fn, *args, **kwargs):
+        '''
+            Run fn(session, *args, **kwargs) with the sync session of given database in the threadpool, in both modes.
+            used for work whose Python processing outweighs its queries, such as building in-memory stores or
+            assembling job information, which run_sync would run on the event loop in async mode.
+        '''
+        async with self.executor.limiter(database):
+            return await run_in_threadpool(fn, self.get(database), *args, **kwargs)
+
+    async def run_connection(self, database:str, fn, *args, **kwargs):
+        '''run fn(connection, *args, **kwargs) with a pooled connection of given database, see DatabaseExecutor.run_connection.'''
+        return await self.executor.run_connection(database, fn, *args, **kwargs)
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+    async def aclose(self):
+        '''close sync and async sessions opened by the request.'''
+        if self._sessions:
+            await run_in_threadpool(self.close)
+        for session in self._async_sessions.values():
+            await session.close()
+        self._async_sessions.clear()
+
+def connection_string(database:str, config:dict, driver:str="pymysql")->str:
+    """return URL of given database, taken from DATABASE_URLS when set there, such as a local server or SQLite file for benchmarks."""
+    url = config.get("DATABASE_URLS", {}).get(database)
+    if url is not None:
+        return url
+    user = config.get("USER")
+    password = config.get("PASSWORD")
+    host = config.get("ENDPOINT")
+    port = config.get("PORT")
+    return f"mysql+{driver}://{user}:{password}@{host}:{port}/{database}"
+
+def create_db_engine(database:str, config:dict):
+    """generate db engine with pool settings through configuration."""
+    method_name = __name__ + ".create_db_engine"
+    try:
+        return create_engine(
+            connection_string(database, config),
+            poolclass=TimedQueuePool,
+            pool_size=config.get("POOL_SIZE", POOL_DEFAULTS["POOL_SIZE"]),
+            max_overflow=config.get("MAX_OVERFLOW", POOL_DEFAULTS["MAX_OVERFLOW"]),
+            pool_timeout=config.get("POOL_TIMEOUT", POOL_DEFAULTS["POOL_TIMEOUT"]),
+            pool_recycle=config.get("POOL_RECYCLE", POOL_DEFAULTS["POOL_RECYCLE"]),
+            pool_pre_ping=config.get("POOL_PRE_PING", POOL_DEFAULTS["POOL_PRE_PING"]),
+        )
+    except Exception as e:
+        logger.log(f"Exception occurred while creating db engine: {e}", flag=1, name=method_name)
+        raise e
+
+def create_async_db_engine(database:str, config:dict):
+    """generate asyncio db engine with pool settings through configuration, using ASYNC_DRIVER (aiomysql by default)."""
+    method_name = __name__ + ".create_async_db_engine"
+    try:
+        driver = config.get("ASYNC_DRIVER", DEFAULT_ASYNC_DRIVER)
+        # URLs of DATABASE_URLS name a sync driver, which is replaced by the async one
+        url = make_url(connection_string(database, config, driver))
+        url = url.set(drivername=f"{url.get_backend_name()}+{driver}")
+        return create_async_engine(
+            url,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=config.get("POOL_SIZE", POOL_DEFAULTS["POOL_SIZE"]),
+            max_overflow=config.get("MAX_OVERFLOW", POOL_DEFAULTS["MAX_OVERFLOW"]),
+            pool_timeout=config.get("POOL_TIMEOUT", POOL_DEFAULTS["POOL_TIMEOUT"]),
+            pool_recycle=config.get("POOL_RECYCLE", POOL_DEFAULTS["POOL_RECYCLE"]),
+            pool_pre_ping=config.get("POOL_PRE_PING", POOL_DEFAULTS["POOL_PRE_PING"]),
+        )
+    except Exception as e:
+        logger.log(f"Exception occurred while creating async db engine: {e}", flag=1, name=method_name)
+        raise e
@@ -0,0 +1,65 @@
+from sqlalchemy import func
+from loaders import JOB_RELATIONS, PID_CHUNK_SIZE
+
+# facets share the relation names of /job_information: dev_stacks, categories and industries
+FACETS = tuple(JOB_RELATIONS.keys())
+# relation kind of search_index.KeywordIndex per facet
+INDEX_KINDS = {'dev_stacks': 'dev_stack', 'categories': 'category', 'industries': 'industry'}
+
+def check_facets(facets:list=None)->list:
+    '''return given facets, or every facet if not set. raise ValueError for unknown facets.'''
+    facets = list(FACETS) if facets is None else facets
+    unknown = [facet for facet in facets if facet not in JOB_RELATIONS]
+    if unknown:
+        raise ValueError(f"Unknown facets: {unknown}")
+    return facets
+
+def rank_counts(counts:dict, top_n:int=None)->dict:
+    '''order counts by descending count then name, keeping the top_n first if set.'''
+    ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return dict(ordered[:top_n] if top_n is not None else ordered)
+
+def count_facets(session, facets:list=None, pid_list:list=None, pid_query=None, top_n:int=None)->dict:
+    '''
+        Count jobs per dev stack, category or industry with GROUP BY, optionally restricted to given jobs.
+        - session: session of database to query
+        - facets(optional): facets to count among dev_stacks, categories and industries. if not set, every facet is counted.
+        - pid_list(optional): pids of jobs to count, queried per chunk of PID_CHUNK_SIZE pids
+        - pid_query(optional): selectable of pids to count, used as an IN subquery
+        - top_n(optional): keep only the top_n most frequent values per facet
+        return dictionary of facet -> {name: number of jobs}, in descending count.
+    '''
+    facets = check_facets(facets)
+    if pid_list is not None:
+        pid_list = list(dict.fromkeys(pid_list))
+        chunks = [pid_list[start:start+PID_CHUNK_SIZE] for start in range(0, len(pid_list), PID_CHUNK_SIZE)]
+    result = {}
+    for facet in facets:
+        link, term, term_id, term_name = JOB_RELATIONS[facet]
+        name_column = getattr(term, term_name)
+        query = (
+            session.query(name_column, func.count(link.pid.distinct()))
+            .join(term, getattr(term, term_id) == getattr(link, term_id))
+            .group_by(name_column)
+        )
+        if pid_query is not None:
+            query = query.filter(link.pid.in_(pid_query))
+        if pid_list is None:
+            counts = dict(query.all())
+        else:
+            # chunks hold distinct pids, so their counts add up
+            counts = {}
+            for chunk in chunks:
+                for name, count in query.filter(link.pid.in_(chunk)).all():
+                    counts[name] = counts.get(name, 0) + count
+        result[facet] = rank_counts(counts, top_n)
+    return result
+
+def count_facets_in_index(index, pid_list, facets:list=None, top_n:int=None)->dict:
+    '''
+        Count jobs per dev stack, category or industry from the term postings of a keyword index, without querying the database.
+        used for keyword matches, which can hold every job. see count_facets for arguments and result.
+    '''
+    facets = check_facets(facets)
+    pids = set(pid_list)
+    return {facet: rank_counts(index.count_terms(INDEX_KINDS[facet], pids), top_n) for facet in facets}
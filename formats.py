@@ -0,0 +1,100 @@
+import io
+from sqlalchemy import text
+from serialization import dumps, json_default
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# response formats of /query: format name -> media type
+MEDIA_TYPES = {
+    "records": "application/json",
+    "columns": "application/vnd.tmi.columns+json",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+DEFAULT_FORMAT = "records"
+ARROW_FORMATS = ("arrow", "parquet")
+
+def available_formats()->list:
+    '''return formats this worker can produce. arrow and parquet need pyarrow.'''
+    return [name for name in MEDIA_TYPES if pa is not None or name not in ARROW_FORMATS]
+
+def negotiate_format(requested:str=None, accept:str=None)->str:
+    '''
+        Pick response format from an explicit format name, or else from the Accept header.
+        unknown or unavailable formats requested explicitly raise ValueError, while Accept falls back to records.
+    '''
+    if requested:
+        if requested not in MEDIA_TYPES:
+            raise ValueError(f"Unknown format {requested}, expected one of {list(MEDIA_TYPES)}")
+        if requested not in available_formats():
+            raise ValueError(f"Format {requested} requires pyarrow, which is not installed")
+        return requested
+    if accept:
+        by_media_type = {MEDIA_TYPES[name]: name for name in available_formats()}
+        accepted = []
+        for position, item in enumerate(accept.split(",")):
+            media_type, *options = [part.strip() for part in item.split(";")]
+            quality = 1.0
+            for option in options:
+                if option.startswith("q="):
+                    try:
+                        quality = float(option[2:])
+                    except ValueError:
+                        quality = 0.0
+            if media_type in by_media_type and quality > 0:
+                accepted.append((-quality, position, by_media_type[media_type]))
+        if accepted:
+            return min(accepted)[2]
+    return DEFAULT_FORMAT
+
+def fetch_rows(connection, query:str, params:dict=None):
+    '''
+        Run given query and return its column names and rows, without building a DataFrame.
+        plain SQL without parameters is sent to the driver as is, like pd.read_sql does.
+    '''
+    if params:
+        result = connection.execute(text(query), params)
+    else:
+        result = connection.exec_driver_sql(query)
+    return list(result.keys()), result.fetchall()
+
+def to_columns(names:list, rows:list)->list:
+    '''return values per column of given rows.'''
+    return [list(values) for values in zip(*rows)] if rows else [[] for _ in names]
+
+def fetch_columns(connection, query:str, params:dict=None):
+    '''run given query and return its column names and values per column, see fetch_rows.'''
+    names, rows = fetch_rows(connection, query, params)
+    return names, to_columns(names, rows)
+
+def encode_columns(names:list, columns:list, format:str, next_cursor=None)->bytes:
+    '''encode column values in given format: columns for column-oriented JSON, arrow for an Arrow IPC stream, or parquet.'''
+    if format == "columns":
+        body = {"columns": names, "data": columns}
+        if next_cursor is not None:
+            body["next_cursor"] = next_cursor
+        return dumps(body)
+    table = to_arrow_table(names, columns)
+    sink = io.BytesIO()
+    if format == "arrow":
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    elif format == "parquet":
+        pq.write_table(table, sink)
+    else:
+        raise ValueError(f"Unknown format {format}")
+    return sink.getvalue()
+
+def to_arrow_table(names:list, columns:list):
+    '''build arrow table from column values, falling back to strings for columns arrow cannot type.'''
+    arrays = []
+    for values in columns:
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([value if value is None or isinstance(value, str) else str(json_default(value)) for value in values]))
+    return pa.Table.from_arrays(arrays, names=names)
@@ -0,0 +1,190 @@
+import hashlib, threading, time
+from datetime import datetime
+from sqlalchemy import bindparam, delete, select
+from sqlalchemy.dialects import mysql, sqlite
+from model import JobInformation, JobStack, DevStack, IncludeCategory, Category, IndustryRelation, Industry
+from utils import Logger
+
+logger = Logger()
+
+# relations of a posting: field -> (link model, term model, term id column, term name column)
+INGEST_RELATIONS = {
+    'dev_stacks': (JobStack, DevStack, 'did', 'dev_stack'),
+    'categories': (IncludeCategory, Category, 'crid', 'job_category'),
+    'industries': (IndustryRelation, Industry, 'iid', 'industry_type'),
+}
+JOB_FIELDS = [column.name for column in JobInformation.__table__.columns]
+# postings sending every NOT NULL column can be inserted, so they are upserted whether they exist or not
+REQUIRED_JOB_FIELDS = frozenset(column.name for column in JobInformation.__table__.columns if not column.nullable)
+DEFAULT_CHUNK_SIZE = 1000
+
+def term_id(name:str)->str:
+    '''return deterministic id of a new term, so every worker creates the same id for the same name.'''
+    return hashlib.sha1(name.encode()).hexdigest()[:20]
+
+def upsert(connection, model, rows:list):
+    '''
+        Insert rows of given model in one multi-row statement, updating non-key columns of rows that already exist.
+        uses INSERT ... ON DUPLICATE KEY UPDATE on MySQL and INSERT ... ON CONFLICT on SQLite.
+    '''
+    if not rows:
+        return
+    table = model.__table__
+    keys = [column.name for column in table.primary_key.columns]
+    updated = [name for name in rows[0] if name not in keys]
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        statement = mysql.insert(table)
+        # rows made of keys only, such as links, are left as they are
+        statement = statement.on_duplicate_key_update({name: statement.inserted[name] for name in (updated or keys[:1])})
+    elif dialect == 'sqlite':
+        statement = sqlite.insert(table)
+        if updated:
+            statement = statement.on_conflict_do_update(index_elements=keys, set_={name: statement.excluded[name] for name in updated})
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=keys)
+    else:
+        raise ValueError(f"Upsert is not supported on {dialect}")
+    connection.execute(statement, rows)
+
+def update(connection, model, rows:list):
+    '''update non-key columns of existing rows of given model in one executemany statement, matching rows by primary key.'''
+    if not rows:
+        return
+    table = model.__table__
+    keys = [column.name for column in table.primary_key.columns]
+    fields = [name for name in rows[0] if name not in keys]
+    if not fields:
+        return
+    # bound names must differ from column names, which are reserved for the SET clause
+    statement = (
+        table.update()
+        .where(*[table.c[key] == bindparam(f"key_{key}") for key in keys])
+        .values({name: bindparam(f"value_{name}") for name in fields})
+    )
+    connection.execute(statement, [{**{f"key_{key}": row[key] for key in keys}, **{f"value_{name}": row[name] for name in fields}} for row in rows])
+
+class TermLookup():
+    '''
+        Name -> id of dev stacks, categories and industries per database, loaded once and extended as terms are resolved.
+        Names missing from the cache are looked up in the database before new terms are created.
+    '''
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, connection, database:str, term, id_column:str, name_column:str, names:set)->tuple:
+        '''return dictionary of name -> id for given names, creating missing terms, and number of created terms.'''
+        key = (database, term.__tablename__)
+        with self._lock:
+            ids = self._ids.get(key)
+        if ids is None:
+            ids = dict(connection.execute(select(getattr(term, name_column), getattr(term, id_column))).all())
+            with self._lock:
+                self._ids[key] = ids
+        missing = [name for name in names if name not in ids]
+        created = 0
+        if missing:
+            rows = connection.execute(select(getattr(term, name_column), getattr(term, id_column)).where(getattr(term, name_column).in_(missing))).all()
+            # the database may compare names case-insensitively, as MySQL collations do, and return "Python" for "python".
+            # rows are mapped back to the requested names, so the stored term is reused rather than duplicated.
+            stored, folded = dict(rows), {}
+            for name, tid in rows:
+                folded.setdefault(name.casefold(), tid)
+            found = {name: stored[name] if name in stored else folded[name.casefold()] for name in missing if name in stored or name.casefold() in folded}
+            new_terms, new_ids = [], {}
+            for name in missing:
+                if name in found:
+                    continue
+                # spellings of one new name differing only in case share a term where the database would match them anyway
+                key = name.casefold() if connection.dialect.name == 'mysql' else name
+                if key not in new_ids:
+                    new_ids[key] = term_id(name)
+                    new_terms.append({id_column: new_ids[key], name_column: name})
+                found[name] = new_ids[key]
+            upsert(connection, term, new_terms)
+            created = len(new_terms)
+            with self._lock:
+                ids.update(found)
+        return {name: ids[name] for name in names}, created
+
+    def drop(self, database:str=None):
+        with self._lock:
+            for key in [key for key in self._ids if database is None or key[0] == database]:
+                del self._ids[key]
+
+def ingest_postings(connection, database:str, postings:list, lookup:TermLookup, chunk_size:int=DEFAULT_CHUNK_SIZE)->dict:
+    '''
+        Upsert postings with their relations, committing one transaction per chunk of postings.
+        - connection: connection of database to write
+        - database: database name, part of the term lookup key
+        - postings: dictionaries of job_information columns, with optional dev_stacks, categories and industries name lists.
+          fields a posting does not send keep their stored values, except get_date, which is always written and
+          defaults to the time of ingestion, so incremental refreshes pick postings up.
+          a relation given, even empty, replaces the links of the posting, while a missing one keeps them.
+        - lookup: term lookup cache of the worker
+        - chunk_size(optional): postings written per transaction, at least 1
+        return dictionary of written rows per table, created terms, elapsed seconds and rows per second.
+    '''
+    method_name = __name__ + ".ingest_postings"
+    if chunk_size < 1:
+        raise ValueError(f"Invalid chunk size: {chunk_size}")
+    start = time.perf_counter()
+    # a pid sent twice is written once, with its last posting
+    postings = list({posting["pid"]: posting for posting in postings}.values())
+    rows = {model.__tablename__: 0 for model in [JobInformation] + [link for link, *_ in INGEST_RELATIONS.values()]}
+    created = {}
+    for chunk_start in range(0, len(postings), chunk_size):
+        chunk = postings[chunk_start:chunk_start+chunk_size]
+        try:
+            now = datetime.now()
+            # postings are written in one statement per set of sent fields, so fields a posting did not send keep their stored values
+            jobs_per_fields = {}
+            for posting in chunk:
+                job = {field: posting[field] for field in JOB_FIELDS if field in posting}
+                if job.get("get_date") is None:
+                    job["get_date"] = now
+                jobs_per_fields.setdefault(frozenset(job), []).append(job)
+            partial = [jobs for fields, jobs in jobs_per_fields.items() if not REQUIRED_JOB_FIELDS <= fields]
+            # existing jobs of partial postings are updated rather than upserted, as the database checks NOT NULL columns
+            # of the inserted row first. updates run one round trip per row on MySQL, so they are kept to those postings.
+            existing = set()
+            if partial:
+                pids = [job["pid"] for jobs in partial for job in jobs]
+                existing = set(connection.execute(select(JobInformation.pid).where(JobInformation.pid.in_(pids))).scalars())
+            for fields, jobs in jobs_per_fields.items():
+                if REQUIRED_JOB_FIELDS <= fields:
+                    upsert(connection, JobInformation, jobs)
+                else:
+                    update(connection, JobInformation, [job for job in jobs if job["pid"] in existing])
+                    upsert(connection, JobInformation, [job for job in jobs if job["pid"] not in existing])
+                rows[JobInformation.__tablename__] += len(jobs)
+            for relation, (link, term, id_column, name_column) in INGEST_RELATIONS.items():
+                given = [posting for posting in chunk if posting.get(relation) is not None]
+                if not given:
+                    continue
+                names = {name for posting in given for name in posting[relation]}
+                ids, created_terms = lookup.resolve(connection, database, term, id_column, name_column, names)
+                created[term.__tablename__] = created.get(term.__tablename__, 0) + created_terms
+                connection.execute(delete(link).where(link.pid.in_([posting["pid"] for posting in given])))
+                links = [{"pid": posting["pid"], id_column: tid} for posting in given for tid in dict.fromkeys(ids[name] for name in posting[relation])]
+                upsert(connection, link, links)
+                rows[link.__tablename__] += len(links)
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            # terms created by the failed chunk are rolled back, so they must be looked up again
+            lookup.drop(database)
+            logger.log(f"Exception occurred while ingesting postings {chunk_start} to {chunk_start + len(chunk)}: {e}", flag=1, name=method_name)
+            raise
+    seconds = time.perf_counter() - start
+    total = sum(rows.values())
+    result = {
+        "postings": len(postings),
+        "rows": rows,
+        "created_terms": created,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(total / seconds, 1) if seconds else None,
+    }
+    logger.log(f"ingested {len(postings)} postings, {total} rows in {seconds:.3f}s", flag=3, name=method_name, rows_per_second=result["rows_per_second"])
+    return result
@@ -0,0 +1,87 @@
+from datetime import datetime
+from model import JobInformation, DevStack, JobStack, Category, IncludeCategory, Industry, IndustryRelation
+from utils import Logger, parse_stored_list
+
+logger = Logger()
+
+# columns of job_information returned by /job_information, in response order
+JOB_COLUMNS = ['job_title', 'company_name', 'job_prefer', 'required_career', 'resume_required',
+               'start_date', 'end_date', 'crawl_url', 'get_date']
+# optional relations: response key -> (link model, term model, term id column, term name column)
+JOB_RELATIONS = {
+    'dev_stacks': (JobStack, DevStack, 'did', 'dev_stack'),
+    'categories': (IncludeCategory, Category, 'crid', 'job_category'),
+    'industries': (IndustryRelation, Industry, 'iid', 'industry_type'),
+}
+DEFAULT_RELATIONS = ('dev_stacks',)
+# bound of pids per IN clause, so a lookup costs one query per relation for up to this many pids
+PID_CHUNK_SIZE = 1000
+
+def parse_job_prefer(value)->list:
+    '''decode job_prefer column into list, returning empty list for missing or malformed values.'''
+    method_name = __name__ + ".parse_job_prefer"
+    if value is None:
+        return []
+    try:
+        return list(parse_stored_list(value))
+    except ValueError as e:
+        logger.log(f"Error parsing job_prefer: {e}", flag=1, name=method_name)
+        return []
+
+def load_job_information(session, pid_list:list, include:list=None)->dict:
+    '''
+        Load job fields and relation names of given pids in a fixed number of queries:
+        one for job_information and one per requested relation, per chunk of PID_CHUNK_SIZE pids.
+        - session: session of database to query
+        - pid_list: pids of jobs to load
+        - include(optional): relations to load among dev_stacks, categories and industries. if not set, only dev_stacks are loaded.
+        return dictionary of pid -> job data, ordered by get_date descending.
+    '''
+    include = list(DEFAULT_RELATIONS) if include is None else include
+    unknown = [relation for relation in include if relation not in JOB_RELATIONS]
+    if unknown:
+        raise ValueError(f"Unknown relations: {unknown}")
+    pid_list = list(dict.fromkeys(pid_list))
+    rows = []
+    relations = {relation: {} for relation in include}
+    for start in range(0, len(pid_list), PID_CHUNK_SIZE):
+        chunk = pid_list[start:start+PID_CHUNK_SIZE]
+        rows.extend(
+            session.query(JobInformation.pid, *[getattr(JobInformation, column) for column in JOB_COLUMNS])
+            .filter(JobInformation.pid.in_(chunk))
+            .all()
+        )
+        for relation in include:
+            link, term, term_id, term_name = JOB_RELATIONS[relation]
+            names = (
+                session.query(link.pid, getattr(term, term_name))
+                .join(term, getattr(term, term_id) == getattr(link, term_id))
+                .filter(link.pid.in_(chunk))
+                .all()
+            )
+            for pid, name in names:
+                relations[relation].setdefault(pid, []).append(name)
+    # chunks are loaded separately, so ordering is applied once over every row
+    rows.sort(key=lambda row: (row.get_date is not None, row.get_date or datetime.min), reverse=True)
+    result = {}
+    for row in rows:
+        job_data = {
+            "job_title": row.job_title,
+            "company_name": row.company_name,
+        }
+        if 'dev_stacks' in relations:
+            job_data["dev_stacks"] = relations['dev_stacks'].get(row.pid, [])  # dev stack list
+        job_data.update({
+            "job_prefer": parse_job_prefer(row.job_prefer),
+            "required_career": row.required_career,
+            "resume_required": row.resume_required,
+            "start_date": row.start_date,
+            "end_date": row.end_date,
+            "crawl_url": row.crawl_url,
+            "get_date": row.get_date,
+        })
+        for relation in include:
+            if relation != 'dev_stacks':
+                job_data[relation] = relations[relation].get(row.pid, [])
+        result[row.pid] = job_data
+    return result
@@ -0,0 +1,221 @@
+import asyncio, functools, threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from fastapi.routing import APIRoute
+from utils import Logger
+
+logger = Logger()
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# timings of the request being served, shared with the threads running its database work
+request_timing = ContextVar("request_timing", default=None)
+
+class RequestTiming():
+    '''per-request accumulation of database time, statements and fetched rows.'''
+    def __init__(self, path:str):
+        self.path = path
+        self.db_seconds = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.endpoint_done = None
+
+class Counter():
+    def __init__(self, name:str, help:str, labels:tuple=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount:float=1, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self)->list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+class Histogram():
+    def __init__(self, name:str, help:str, labels:tuple=(), buckets:tuple=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value:float, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self)->list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), key + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+def format_labels(names:tuple, values:tuple)->str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+class Metrics():
+    '''
+        Process-wide request and database metrics, rendered in Prometheus text format.
+        - slow_query_seconds: statements slower than this are written to the WARN log with their SQL. None disables the slow query log.
+    '''
+    def __init__(self, slow_query_seconds:float=None):
+        self.slow_query_seconds = slow_query_seconds
+        self.request_latency = Histogram("tmi_request_duration_seconds", "Latency of API requests.", ("method", "path", "status"))
+        self.request_db_time = Histogram("tmi_request_db_seconds", "Database time spent per API request.", ("path",))
+        self.stage_time = Histogram("tmi_stage_duration_seconds", "Time spent per request stage such as dataframe conversion or encoding.", ("path", "stage"))
+        self.statement_time = Histogram("tmi_db_statement_duration_seconds", "Duration of SQL statements.", ("database", "operation"))
+        self.rows_fetched = Counter("tmi_db_rows_total", "Rows returned or affected by SQL statements.", ("database", "operation"))
+        self.slow_queries = Counter("tmi_db_slow_queries_total", "SQL statements slower than the slow query threshold.", ("database",))
+        self.collectors = []
+
+    @contextmanager
+    def stage(self, stage:str):
+        '''record time spent in given stage of the current request.'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing = request_timing.get()
+            self.stage_time.observe(time.perf_counter() - start, path=timing.path if timing else "", stage=stage)
+
+    def observe_request(self, method:str, path:str, status:int, seconds:float, timing:RequestTiming=None):
+        self.request_latency.observe(seconds, method=method, path=path, status=status)
+        if timing is not None:
+            self.request_db_time.observe(timing.db_seconds, path=path)
+
+    def observe_statement(self, database:str, statement:str, seconds:float, rows:int):
+        method_name = __name__ + ".observe_statement"
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+        self.statement_time.observe(seconds, database=database, operation=operation)
+        if rows is not None and rows >= 0:
+            self.rows_fetched.inc(rows, database=database, operation=operation)
+        timing = request_timing.get()
+        if timing is not None:
+            timing.db_seconds += seconds
+            timing.statements += 1
+            timing.rows += max(rows or 0, 0)
+        if self.slow_query_seconds is not None and seconds >= self.slow_query_seconds:
+            self.slow_queries.inc(database=database)
+            sql = " ".join(statement.split())
+            logger.log(f"slow query: {sql[:2000]}", flag=2, name=method_name, database=database, duration_ms=round(seconds * 1000, 3), rows=rows, path=timing.path if timing else "")
+
+    def add_collector(self, collector):
+        '''register callable returning extra exposition lines, such as pool gauges, at render time.'''
+        self.collectors.append(collector)
+
+    def render(self)->str:
+        lines = []
+        for metric in (self.request_latency, self.request_db_time, self.stage_time, self.statement_time, self.rows_fetched, self.slow_queries):
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+def pool_collector(pool_stats):
+    '''return collector exposing checkout and wait statistics from given pool_stats callable.'''
+    gauges = {
+        "checked_out": ("tmi_db_pool_checked_out", "gauge", "Connections currently checked out."),
+        "overflow": ("tmi_db_pool_overflow", "gauge", "Overflow connections currently open."),
+        "checkouts": ("tmi_db_pool_checkouts_total", "counter", "Connections checked out of the pool."),
+        "waits": ("tmi_db_pool_waits_total", "counter", "Checkouts that waited for a free connection."),
+        "wait_seconds": ("tmi_db_pool_wait_seconds_total", "counter", "Seconds spent waiting for a free connection."),
+        "timeouts": ("tmi_db_pool_timeouts_total", "counter", "Checkouts that timed out."),
+    }
+    def collect()->list:
+        stats = pool_stats()
+        lines = []
+        for key, (name, kind, help) in gauges.items():
+            lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {kind}"])
+            for database, values in stats.items():
+                if key in values:
+                    lines.append(f"{name}{format_labels(('database',), (database,))} {values[key]}")
+        return lines
+    return collect
+
+def instrument_engines(metrics:Metrics):
+    '''time every statement executed by any engine of the process, sync or async, through cursor execute events.'''
+    @event.listens_for(Engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if not starts:
+            return
+        seconds = time.perf_counter() - starts.pop()
+        metrics.observe_statement(conn.engine.url.database or "", statement, seconds, getattr(cursor, "rowcount", None))
+
+    @event.listens_for(Engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+class TimedRoute(APIRoute):
+    '''
+        Route recording time spent in the endpoint and in serializing its return value
+        (validation, jsonable_encoder and rendering) as stages of the request.
+    '''
+    metrics = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        call = self.dependant.call
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def timed_call(*args, **kwargs):
+                with self.metrics.stage("endpoint"):
+                    result = await call(*args, **kwargs)
+                mark_endpoint_done()
+                return result
+        else:
+            @functools.wraps(call)
+            def timed_call(*args, **kwargs):
+                with self.metrics.stage("endpoint"):
+                    result = call(*args, **kwargs)
+                mark_endpoint_done()
+                return result
+        self.dependant.call = timed_call
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        async def timed_handler(request):
+            response = await handler(request)
+            timing = request_timing.get()
+            if self.metrics is not None and timing is not None and timing.endpoint_done is not None:
+                self.metrics.stage_time.observe(time.perf_counter() - timing.endpoint_done, path=timing.path, stage="serialize")
+            return response
+        return timed_handler
+
+def mark_endpoint_done():
+    timing = request_timing.get()
+    if timing is not None:
+        timing.endpoint_done = time.perf_counter()
@@ -0,0 +1,236 @@
+import asyncio, re, threading, time
+from collections import OrderedDict
+from utils import Logger
+
+logger = Logger()
+
+# string literals and quoted identifiers are kept as is while normalizing
+QUOTED_PATTERN = re.compile(r"('(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)")
+# identifiers, possibly qualified by a schema, and single punctuation characters
+TOKEN_PATTERN = re.compile(r"(?:`[^`]+`|[A-Za-z_][A-Za-z0-9_$]*)(?:\s*\.\s*(?:`[^`]+`|[A-Za-z_][A-Za-z0-9_$]*))?|[^\sA-Za-z_]")
+# keywords that may follow a table reference, which are never its alias
+CLAUSE_KEYWORDS = frozenset((
+    'where', 'join', 'inner', 'left', 'right', 'full', 'cross', 'natural', 'straight_join', 'on', 'using', 'group', 'order',
+    'having', 'limit', 'offset', 'union', 'except', 'intersect', 'window', 'for', 'lock', 'into', 'set', 'use', 'force',
+    'ignore', 'partition', 'values', 'select', 'returning', 'fetch',
+))
+WHITESPACE_PATTERN = re.compile(r"\s+")
+READ_ONLY_PATTERN = re.compile(r"^\s*\(?\s*(select|with|show)\b", re.IGNORECASE)
+
+def normalize_sql(sql:str)->str:
+    '''
+        collapse whitespace outside quoted literals and drop the trailing semicolon.
+        case is kept, since column aliases become the keys of the cached records.
+    '''
+    parts = QUOTED_PATTERN.split(sql.strip().rstrip(';'))
+    # split keeps quoted literals at odd positions
+    return "".join(part if index % 2 else WHITESPACE_PATTERN.sub(" ", part) for index, part in enumerate(parts)).strip()
+
+def is_identifier(token:str)->bool:
+    return token[0] == '`' or token[0].isalpha() or token[0] == '_'
+
+def table_name(token:str)->str:
+    return token.split(".")[-1].strip().strip('`').lower()
+
+def referenced_tables(sql:str)->frozenset:
+    '''
+        return lowercase names of tables referenced by given statement, without schema or quotes.
+        FROM of a function such as EXTRACT(YEAR FROM get_date) is told apart by the SELECT or DELETE of its level.
+        return an empty set when a table list cannot be parsed, so the statement is treated as referencing any table.
+    '''
+    unquoted = QUOTED_PATTERN.sub(lambda match: match.group(0) if match.group(0).startswith('`') else "''", sql)
+    tokens = TOKEN_PATTERN.findall(unquoted)
+    tables = set()
+    # whether each open parenthesis level holds a SELECT or DELETE, whose FROM lists tables
+    levels = [False]
+
+    def read_list(i:int, single:bool)->int:
+        '''add tables of the comma-separated table references starting at tokens[i], return index after them or -1 if unparsed.'''
+        while True:
+            if i >= len(tokens):
+                return -1
+            if tokens[i] == '(':
+                # derived table, whose own tables are read as the statement is scanned
+                depth, j = 0, i
+                while j < len(tokens):
+                    depth += {'(': 1, ')': -1}.get(tokens[j], 0)
+                    if depth == 0:
+                        break
+                    j += 1
+                if j == len(tokens):
+                    return -1
+                after = j + 1
+            elif is_identifier(tokens[i]) and tokens[i].lower() not in CLAUSE_KEYWORDS:
+                tables.add(table_name(tokens[i]))
+                after = i + 1
+            else:
+                return -1
+            if single:
+                return after
+            if after < len(tokens) and tokens[after].lower() == 'as':
+                after += 2
+            elif after < len(tokens) and is_identifier(tokens[after]) and tokens[after].lower() not in CLAUSE_KEYWORDS:
+                after += 1
+            if after >= len(tokens) or tokens[after] != ',':
+                return after
+            i = after + 1
+
+    for i, token in enumerate(tokens):
+        keyword = token.lower()
+        if token == '(':
+            levels.append(False)
+        elif token == ')':
+            if len(levels) > 1:
+                levels.pop()
+        elif keyword in ('select', 'delete'):
+            levels[-1] = True
+        elif keyword == 'from' and levels[-1] or keyword == 'update' and (i == 0 or tokens[i - 1].lower() not in ('key', 'for')):
+            if read_list(i + 1, single=False) < 0:
+                return frozenset()
+        elif keyword in ('join', 'into', 'table'):
+            if read_list(i + 1, single=True) < 0:
+                return frozenset()
+    return frozenset(tables)
+
+def is_cacheable(sql:str)->bool:
+    '''only single read-only statements are cached.'''
+    return bool(READ_ONLY_PATTERN.match(sql)) and ';' not in QUOTED_PATTERN.sub("''", sql.strip().rstrip(';'))
+
+class CachedResponse():
+    '''pre-serialized response body with the tables it was read from.'''
+    def __init__(self, content:bytes, media_type:str, headers:dict=None, tables:frozenset=frozenset()):
+        self.content = content
+        self.media_type = media_type
+        self.headers = headers
+        self.tables = tables
+
+class QueryResultCache():
+    '''
+        Cache of serialized query results keyed by (database, normalized SQL, variant) with expiry and byte-bounded LRU eviction.
+        Entries are tagged with the tables their statement references, so writes to a table drop every result read from it.
+        Concurrent misses of the same key share one computation.
+        - max_bytes: total size of cached bodies kept before the least recently used ones are evicted
+        - ttl: seconds an entry stays valid
+        - max_entry_bytes(optional): larger bodies are not cached. defaults to an eighth of max_bytes.
+    '''
+    def __init__(self, max_bytes:int=64*1024*1024, ttl:float=60, max_entry_bytes:int=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 8
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._inflight = {}
+        self._size = 0
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expirations": 0, "invalidations": 0, "uncacheable": 0}
+
+    @staticmethod
+    def key(database:str, sql:str, params:dict=None, variant:tuple=())->tuple:
+        return (database, normalize_sql(sql), tuple(sorted((params or {}).items())), variant)
+
+    async def get_or_compute(self, key:tuple, compute)->CachedResponse:
+        '''
+            return cached response of given key, or await compute() once for every concurrent caller and cache its result.
+            compute must return a CachedResponse.
+            if the caller computing it is cancelled, a waiting caller takes the computation over.
+        '''
+        while True:
+            cached = self._get(key)
+            if cached is not None:
+                return cached
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            self.counters["coalesced"] += 1
+            response = await asyncio.shield(future)
+            # None is set when the computing caller was cancelled, such as by a client disconnect
+            if response is not None:
+                return response
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generations.get(key[0], 0)
+        try:
+            response = await compute()
+        except asyncio.CancelledError:
+            future.set_result(None)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # retrieve the exception, so it is not reported as never retrieved when nobody else waited
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(response)
+        self._put(key, response, generation)
+        return response
+
+    def _get(self, key:tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            response, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                self.counters["expirations"] += 1
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return response
+
+    def _put(self, key:tuple, response:CachedResponse, generation:int):
+        size = len(response.content)
+        with self._lock:
+            # results computed while their database was written to may already be stale
+            if generation != self._generations.get(key[0], 0):
+                return
+            if size > self.max_entry_bytes:
+                self.counters["uncacheable"] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (response, time.time() + self.ttl)
+            self._size += size
+            for table in response.tables or (None,):
+                self._tags.setdefault((key[0], table), set()).add(key)
+            while self._size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+
+    def _remove(self, key:tuple):
+        response, _ = self._entries.pop(key)
+        self._size -= len(response.content)
+        for table in response.tables or (None,):
+            keys = self._tags.get((key[0], table))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[(key[0], table)]
+
+    def invalidate(self, database:str, tables=None)->int:
+        '''
+            Drop cached results of given database read from any of given tables. if tables is not set, every result of the database is dropped.
+            results whose tables could not be determined are dropped on any invalidation of their database.
+            return number of dropped entries.
+        '''
+        tables = None if tables is None else {table.lower() for table in tables}
+        with self._lock:
+            if tables is None:
+                keys = [key for key in self._entries if key[0] == database]
+            else:
+                keys = set(self._tags.get((database, None), ()))
+                for table in tables:
+                    keys |= self._tags.get((database, table), set())
+            for key in keys:
+                self._remove(key)
+            self._generations[database] = self._generations.get(database, 0) + 1
+            self.counters["invalidations"] += len(keys)
+            return len(keys)
+
+    def stats(self)->dict:
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), bytes=self._size, max_bytes=self.max_bytes, inflight=len(self._inflight))
@@ -0,0 +1,64 @@
+import threading, time
+from utils import Logger
+
+logger = Logger()
+
+class RefreshableStore():
+    '''
+        Base of worker-local stores whose entries are built from the database and refreshed from the get_date watermark.
+        Entries expose built_at, refreshed_at and refresh_lock, and implement build(session) and refresh(session).
+        build must prepare new contents aside and swap them in at once, so the entry can be read while it is rebuilt.
+        - refresh_interval: seconds after which the next lookup applies newly crawled rows
+        - rebuild_interval: seconds after which the next lookup starts a full rebuild, dropping deleted rows
+        - session_factory(optional): callable returning the sessionmaker of given database, used by background rebuilds.
+          if not set, rebuilds run in the calling thread.
+    '''
+    def __init__(self, refresh_interval:float=60, rebuild_interval:float=3600, session_factory=None):
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.session_factory = session_factory
+
+    def ensure_fresh(self, entry, session, database:str):
+        '''
+            Bring given entry up to date and return it.
+            Only an entry never built makes its callers wait, for a single build. A due refresh is applied by one caller
+            while the others serve the current contents, and a due rebuild runs in a background thread.
+        '''
+        if entry.built_at is None:
+            with entry.refresh_lock:
+                if entry.built_at is None:
+                    entry.build(session)
+            return entry
+        now = time.monotonic()
+        if now - entry.built_at >= self.rebuild_interval:
+            if entry.refresh_lock.acquire(blocking=False):
+                self._rebuild(entry, session, database)
+        elif now - entry.refreshed_at >= self.refresh_interval:
+            if entry.refresh_lock.acquire(blocking=False):
+                try:
+                    entry.refresh(session)
+                finally:
+                    entry.refresh_lock.release()
+        return entry
+
+    def _rebuild(self, entry, session, database:str):
+        '''rebuild given entry, whose refresh lock is held and released once the rebuild is done.'''
+        if self.session_factory is None:
+            try:
+                entry.build(session)
+            finally:
+                entry.refresh_lock.release()
+            return
+
+        def rebuild():
+            method_name = __name__ + ".rebuild"
+            try:
+                with self.session_factory(database)() as background_session:
+                    entry.build(background_session)
+            except Exception as e:
+                # the entry keeps its contents and the next lookup starts another rebuild
+                logger.log(f"Exception occurred while rebuilding {type(entry).__name__} of {database}: {e}", flag=1, name=method_name)
+            finally:
+                entry.refresh_lock.release()
+
+        threading.Thread(target=rebuild, name=f"rebuild-{database}", daemon=True).start()
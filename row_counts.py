@@ -0,0 +1,147 @@
+import threading, time
+from collections import OrderedDict
+from sqlalchemy import func, text
+from model import JobInformation
+from refreshable import RefreshableStore
+from utils import Logger
+
+logger = Logger()
+
+MODES = ('approx', 'exact')
+
+def filter_key(filters:dict)->tuple:
+    '''return hashable, order independent key of given filters.'''
+    return tuple(sorted((column, tuple(value) if isinstance(value, list) else value) for column, value in (filters or {}).items()))
+
+def filter_clauses(model, filters:dict)->list:
+    '''
+        Build where clauses of given filters on columns of model: a list value matches any of its elements, None matches NULL.
+        raise ValueError for columns that model does not have.
+    '''
+    clauses = []
+    for column_name, value in (filters or {}).items():
+        if column_name not in model.__table__.c:
+            raise ValueError(f"Unknown column {column_name} of table {model.__tablename__}")
+        column = model.__table__.c[column_name]
+        if isinstance(value, list):
+            clauses.append(column.in_(value))
+        elif value is None:
+            clauses.append(column.is_(None))
+        else:
+            clauses.append(column == value)
+    return clauses
+
+def approximate_row_count(connection, table_name:str):
+    '''return row count estimate of given table from information_schema, or None if the database keeps no such statistics.'''
+    if connection.dialect.name != 'mysql':
+        return None
+    return connection.execute(
+        text("SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table"),
+        {"table": table_name},
+    ).scalar()
+
+class RowCount():
+    '''
+        Exact row count of one table under given filters. For unfiltered counts of tables holding pids, the rows counted
+        per pid are kept, so rows recrawled after the get_date watermark replace their previous contribution.
+        Filtered counts keep only their total and are recounted on refresh, so every filter combination costs one
+        integer rather than one entry per pid of the table.
+    '''
+    def __init__(self, model, filters:dict=None):
+        self.model = model
+        self.filters = dict(filters or {})
+        self.clauses = filter_clauses(model, self.filters)
+        self.total = 0
+        self.contributions = {}
+        self.watermark = None
+        self.built_at = None
+        self.refreshed_at = None
+        self.updated_at = None
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+
+    @property
+    def is_incremental(self)->bool:
+        '''only tables with a pid can follow get_date of job_information, and only unfiltered counts keep per pid contributions.'''
+        return 'pid' in self.model.__table__.c and not self.filters
+
+    def build(self, session):
+        method_name = __name__ + ".build"
+        start = time.perf_counter()
+        contributions, watermark = {}, None
+        if self.is_incremental:
+            for pid, count, get_date in self._count_per_pid(session):
+                contributions[pid] = count
+                if get_date is not None and (watermark is None or get_date > watermark):
+                    watermark = get_date
+            total = sum(contributions.values())
+        else:
+            total = session.query(func.count()).select_from(self.model).filter(*self.clauses).scalar()
+        with self.lock:
+            self.total, self.contributions, self.watermark = total, contributions, watermark
+            self.built_at = self.refreshed_at = time.monotonic()
+            self.updated_at = time.time()
+        logger.log(f"counted {total} rows of {self.model.__tablename__} in {time.perf_counter() - start:.3f}s", flag=3, name=method_name)
+
+    def refresh(self, session)->int:
+        '''
+            Apply rows crawled since the last build or refresh. tables without pid and filtered counts are recounted instead.
+            return number of refreshed pids.
+        '''
+        if not self.is_incremental or self.built_at is None or self.watermark is None:
+            self.build(session)
+            return len(self.contributions)
+        # pids recrawled since the watermark may have lost rows, so every one of them is reset first
+        changed = (
+            session.query(JobInformation.pid, JobInformation.get_date)
+            .filter(JobInformation.get_date >= self.watermark)
+            .all()
+        )
+        counts = {pid: count for pid, count, _ in self._count_per_pid(session, since=self.watermark)}
+        with self.lock:
+            for pid, get_date in changed:
+                self.total += counts.get(pid, 0) - self.contributions.get(pid, 0)
+                if counts.get(pid):
+                    self.contributions[pid] = counts[pid]
+                else:
+                    self.contributions.pop(pid, None)
+                if get_date is not None and get_date > self.watermark:
+                    self.watermark = get_date
+            self.refreshed_at = time.monotonic()
+            self.updated_at = time.time()
+        return len(changed)
+
+    def _count_per_pid(self, session, since=None):
+        '''yield (pid, rows, get_date) per pid, joining relation tables to job_information for get_date.'''
+        model = self.model
+        query = session.query(model.pid, func.count(), JobInformation.get_date)
+        if model is not JobInformation:
+            query = query.join(JobInformation, JobInformation.pid == model.pid)
+        if since is not None:
+            query = query.filter(JobInformation.get_date >= since)
+        return query.group_by(model.pid, JobInformation.get_date).all()
+
+class RowCountStore(RefreshableStore):
+    '''
+        Cached exact row counts per (database, table, filters). unfiltered counts are refreshed incrementally from get_date,
+        filtered ones are recounted, so per pid state is held at most once per table.
+        - max_entries: number of filter combinations kept before the least recently used one is dropped
+        see RefreshableStore for refresh_interval, rebuild_interval and session_factory.
+    '''
+    def __init__(self, refresh_interval:float=60, rebuild_interval:float=3600, max_entries:int=256, session_factory=None):
+        super().__init__(refresh_interval, rebuild_interval, session_factory)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session, database:str, model, filters:dict=None)->RowCount:
+        '''return up-to-date exact row count of given table and filters, counting it on first use.'''
+        key = (database, model.__tablename__, filter_key(filters))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = RowCount(model, filters)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(key)
+        return self.ensure_fresh(entry, session, database)
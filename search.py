@@ -0,0 +1,87 @@
+from sqlalchemy import and_, case, exists, literal, or_, select
+from model import JobInformation
+from loaders import JOB_RELATIONS
+
+# relevance of a keyword match per job field or relation name, summed into the score of a job
+FIELD_WEIGHTS = {
+    'job_title': 4,
+    'company_name': 2,
+    'site_symbol': 1,
+    'crawl_domain': 1,
+    'crawl_url': 1,
+}
+RELATION_WEIGHTS = {
+    'dev_stacks': 3,
+    'categories': 2,
+    'industries': 1,
+}
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 1000
+
+def parse_cursor(cursor:str)->tuple:
+    '''decode "score:pid" cursor returned as next_cursor into (score, pid).'''
+    score, separator, pid = cursor.partition(":")
+    if not separator:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return int(score), pid
+
+def format_cursor(score:int, pid:str)->str:
+    return f"{score}:{pid}"
+
+def relation_exists(relation:str, condition):
+    '''return EXISTS clause matching jobs linked to a term of given relation satisfying condition on its name column.'''
+    link, term, term_id, term_name = JOB_RELATIONS[relation]
+    return exists(
+        select(literal(1))
+        .select_from(link)
+        .join(term, getattr(term, term_id) == getattr(link, term_id))
+        .where(link.pid == JobInformation.pid, condition(getattr(term, term_name)))
+    )
+
+def build_ranked_search(keyword:str=None, filters:dict=None, start_date=None, end_date=None):
+    '''
+        Build one statement selecting pid and relevance score of jobs matching keyword and filters.
+        - keyword(optional): LIKE '%keyword%' over job fields and dev stack, category and industry names, weighted by
+          FIELD_WEIGHTS and RELATION_WEIGHTS. jobs matching nothing are left out. if not set, every job scores 0.
+        - filters(optional): dev_stacks, categories, industries, site_symbol or required_career -> accepted values.
+          a job must hold one of the values of every given filter.
+        - start_date, end_date(optional): window the posting period of a job must overlap
+        return subquery with pid and score columns.
+    '''
+    conditions = []
+    for name, values in (filters or {}).items():
+        if not values:
+            continue
+        if name in JOB_RELATIONS:
+            conditions.append(relation_exists(name, lambda column, values=values: column.in_(values)))
+        elif name in ('site_symbol', 'required_career'):
+            conditions.append(getattr(JobInformation, name).in_(values))
+        else:
+            raise ValueError(f"Unknown filter: {name}")
+    if start_date is not None:
+        conditions.append(or_(JobInformation.end_date.is_(None), JobInformation.end_date >= start_date))
+    if end_date is not None:
+        conditions.append(or_(JobInformation.start_date.is_(None), JobInformation.start_date <= end_date))
+    if keyword:
+        pattern = f"%{keyword}%"
+        matches = [(getattr(JobInformation, field).like(pattern), weight) for field, weight in FIELD_WEIGHTS.items()]
+        matches += [(relation_exists(relation, lambda column: column.like(pattern)), weight) for relation, weight in RELATION_WEIGHTS.items()]
+        score = sum(case((match, weight), else_=0) for match, weight in matches)
+        conditions.append(or_(*[match for match, _ in matches]))
+    else:
+        score = literal(0)
+    return select(JobInformation.pid, score.label('score')).where(*conditions).subquery('ranked')
+
+def ranked_page(session, ranked, cursor:str=None, limit:int=DEFAULT_LIMIT)->tuple:
+    '''
+        return page of (pid, score) by descending score and ascending pid, starting after cursor, and the cursor of the next page.
+        next cursor is None when the page is the last one.
+    '''
+    query = select(ranked.c.pid, ranked.c.score).order_by(ranked.c.score.desc(), ranked.c.pid)
+    if cursor is not None:
+        score, pid = parse_cursor(cursor)
+        query = query.where(or_(ranked.c.score < score, and_(ranked.c.score == score, ranked.c.pid > pid)))
+    # fetch one extra row to know whether another page follows
+    rows = session.execute(query.limit(limit + 1)).all()
+    next_cursor = format_cursor(rows[limit - 1].score, rows[limit - 1].pid) if len(rows) > limit and limit > 0 else None
+    return [(row.pid, row.score) for row in rows[:limit]], next_cursor
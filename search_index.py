@@ -0,0 +1,261 @@
+import threading, time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import chain
+from model import JobInformation, DevStack, JobStack, Category, IncludeCategory, Industry, IndustryRelation
+from utils import Logger
+from refreshable import RefreshableStore
+
+logger = Logger()
+
+# columns of job_information matched by keyword search
+SEARCH_FIELDS = ['job_title', 'site_symbol', 'crawl_url', 'crawl_domain', 'company_name']
+# relation tables matched by keyword search: (link model, term model, term id column, term name column)
+SEARCH_RELATIONS = {
+    'dev_stack': (JobStack, DevStack, 'did', 'dev_stack'),
+    'category': (IncludeCategory, Category, 'crid', 'job_category'),
+    'industry': (IndustryRelation, Industry, 'iid', 'industry_type'),
+}
+GRAM_SIZE = 3
+FIELD_SEPARATOR = "\x00"
+CHUNK_SIZE = 1000
+# keywords containing LIKE wildcards or escapes are left to the SQL path
+LIKE_SPECIAL_CHARACTERS = ('%', '_', '\\')
+# binary searches into a posting list beat one pass over it when it is this many times longer than the probed ids
+PROBE_RATIO = 32
+
+def normalize(value)->str:
+    '''lowercase given value the way a case-insensitive collation compares it.'''
+    return str(value).casefold() if value is not None else ""
+
+def grams(text:str)->set:
+    '''return character n-grams of given text, skipping grams crossing field boundaries.'''
+    return {text[i:i+GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1) if FIELD_SEPARATOR not in text[i:i+GRAM_SIZE]}
+
+def is_indexable(keyword:str)->bool:
+    '''return True if given keyword means the same as a literal substring under LIKE.'''
+    return not any(char in keyword for char in LIKE_SPECIAL_CHARACTERS)
+
+def chunks(values:list, size:int=CHUNK_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i+size]
+
+def posting_list():
+    return array('I')
+
+def contains(posting:array, doc_id:int)->bool:
+    '''return True if given ascending posting list holds doc_id.'''
+    i = bisect_left(posting, doc_id)
+    return i < len(posting) and posting[i] == doc_id
+
+def intersect(doc_ids:set, posting:array)->set:
+    '''return doc ids of given set found in given ascending posting list.'''
+    if len(doc_ids) * PROBE_RATIO < len(posting):
+        return {doc_id for doc_id in doc_ids if contains(posting, doc_id)}
+    return doc_ids.intersection(posting)
+
+class KeywordIndex():
+    '''
+        In-memory inverted index answering substring keyword search over job_information and its dev stack,
+        category and industry relations, equivalent to LIKE '%keyword%' on the same columns.
+        - documents get ascending int ids, and postings are arrays of those ids in ascending order
+        - job fields are indexed as trigram -> doc id posting lists and verified against the stored text
+        - relation terms are matched against their (small) vocabulary and expanded through term -> doc id posting lists
+        a reindexed document gets a new id and its old id is only marked deleted, so postings stay append-only
+        until the next build.
+    '''
+    def __init__(self, database:str):
+        self.database = database
+        self._ids = {}
+        self._pids = []
+        self._docs = []
+        self._postings = defaultdict(posting_list)
+        self._terms = {kind: {} for kind in SEARCH_RELATIONS}
+        self._names = {kind: {} for kind in SEARCH_RELATIONS}
+        self._term_ids = {kind: defaultdict(posting_list) for kind in SEARCH_RELATIONS}
+        self.watermark = None
+        self.built_at = None
+        self.refreshed_at = None
+        self._lock = threading.RLock()
+        self.refresh_lock = threading.Lock()
+
+    @property
+    def is_built(self)->bool:
+        return self.built_at is not None
+
+    def build(self, session):
+        '''build the whole index from the database, replacing current contents.'''
+        method_name = __name__ + ".build"
+        start = time.perf_counter()
+        fresh = KeywordIndex(self.database)
+        rows = session.query(JobInformation.pid, JobInformation.get_date, *[getattr(JobInformation, f) for f in SEARCH_FIELDS]).yield_per(CHUNK_SIZE)
+        for row in rows:
+            fresh._add_document(row)
+        fresh._load_terms(session)
+        for kind, (link, _, term_id, _) in SEARCH_RELATIONS.items():
+            fresh._link(kind, session.query(link.pid, getattr(link, term_id)).yield_per(CHUNK_SIZE))
+        with self._lock:
+            self._ids, self._pids, self._docs, self._postings = fresh._ids, fresh._pids, fresh._docs, fresh._postings
+            self._terms, self._names, self._term_ids = fresh._terms, fresh._names, fresh._term_ids
+            self.watermark = fresh.watermark
+            self.built_at = self.refreshed_at = time.monotonic()
+        logger.log(f"built keyword index of {self.database} with {len(self._ids)} documents in {time.perf_counter() - start:.3f}s", flag=3, name=method_name)
+
+    def refresh(self, session)->int:
+        '''
+            Incrementally index rows crawled since the last build or refresh, using get_date as watermark.
+            Deleted rows are only dropped by a full build. return number of reindexed documents.
+        '''
+        if not self.is_built:
+            self.build(session)
+            return len(self._ids)
+        query = session.query(JobInformation.pid, JobInformation.get_date, *[getattr(JobInformation, f) for f in SEARCH_FIELDS])
+        if self.watermark is not None:
+            query = query.filter(JobInformation.get_date >= self.watermark)
+        rows = query.all()
+        pids = [row.pid for row in rows]
+        links = {kind: [] for kind in SEARCH_RELATIONS}
+        for kind, (link, _, term_id, _) in SEARCH_RELATIONS.items():
+            for chunk in chunks(pids):
+                links[kind].extend(session.query(link.pid, getattr(link, term_id)).filter(link.pid.in_(chunk)).all())
+        with self._lock:
+            self._load_terms(session)
+            for row in rows:
+                self._remove_document(row.pid)
+                self._add_document(row)
+            for kind, pairs in links.items():
+                self._link(kind, pairs)
+            self.refreshed_at = time.monotonic()
+        return len(rows)
+
+    def search(self, keyword:str)->list:
+        '''return sorted pids whose job fields or related terms contain given keyword.'''
+        keyword = normalize(keyword)
+        with self._lock:
+            if not keyword:
+                return sorted(self._ids)
+            result = self._search_documents(keyword)
+            for kind in SEARCH_RELATIONS:
+                for tid, name in self._terms[kind].items():
+                    if keyword in name:
+                        result.update(doc_id for doc_id in self._term_ids[kind].get(tid, ()) if self._docs[doc_id] is not None)
+            return sorted(self._pids[doc_id] for doc_id in result)
+
+    def count_terms(self, kind:str, pids:set)->dict:
+        '''return number of given pids linked to each term name of given relation kind, counting a pid once per name.'''
+        with self._lock:
+            doc_ids = set(map(self._ids.get, pids))
+            doc_ids.discard(None)
+            tids_per_name = defaultdict(list)
+            for tid, name in self._names[kind].items():
+                tids_per_name[name].append(tid)
+            counts = {}
+            for name, tids in tids_per_name.items():
+                linked = [self._term_ids[kind][tid] for tid in tids if tid in self._term_ids[kind]]
+                if not linked:
+                    continue
+                # doc ids are live ones only, so deleted ids left in postings are never counted
+                count = len(doc_ids.intersection(chain.from_iterable(linked)))
+                if count:
+                    counts[name] = count
+        return counts
+
+    def check_consistency(self, session, keywords:list, sql_search)->dict:
+        '''
+            Compare index results with the SQL search path for given keywords.
+            - sql_search: callable(session, keyword) returning pids found through SQL
+            return dictionary of keyword -> pids missing from and extra in the index, along with overall consistency.
+        '''
+        report = {"consistent": True, "keywords": {}}
+        for keyword in keywords:
+            expected = set(sql_search(session, keyword))
+            actual = set(self.search(keyword))
+            missing = sorted(expected - actual)
+            extra = sorted(actual - expected)
+            report["keywords"][keyword] = {"sql": len(expected), "index": len(actual), "missing": missing, "extra": extra}
+            if missing or extra:
+                report["consistent"] = False
+        return report
+
+    def stats(self)->dict:
+        with self._lock:
+            return {
+                "documents": len(self._ids),
+                "grams": len(self._postings),
+                "terms": {kind: len(terms) for kind, terms in self._terms.items()},
+                "watermark": self.watermark,
+            }
+
+    def _search_documents(self, keyword:str)->set:
+        keyword_grams = grams(keyword)
+        # short keywords and keywords containing the field separator have no gram to look up
+        if not keyword_grams:
+            if FIELD_SEPARATOR in keyword:
+                # a field match never crosses into the next field
+                return {doc_id for doc_id, text in enumerate(self._docs) if text is not None and any(keyword in field for field in text.split(FIELD_SEPARATOR))}
+            return {doc_id for doc_id, text in enumerate(self._docs) if text is not None and keyword in text}
+        # intersect posting lists starting from the rarest gram, then verify the full substring
+        postings = sorted((self._postings.get(gram, ()) for gram in keyword_grams), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates = intersect(candidates, posting)
+        return {doc_id for doc_id in candidates if self._docs[doc_id] is not None and keyword in self._docs[doc_id]}
+
+    def _add_document(self, row):
+        text = FIELD_SEPARATOR.join(normalize(getattr(row, field)) for field in SEARCH_FIELDS)
+        doc_id = self._ids[row.pid] = len(self._docs)
+        self._pids.append(row.pid)
+        self._docs.append(text)
+        for gram in grams(text):
+            self._postings[gram].append(doc_id)
+        if row.get_date is not None and (self.watermark is None or row.get_date > self.watermark):
+            self.watermark = row.get_date
+
+    def _remove_document(self, pid:str):
+        doc_id = self._ids.pop(pid, None)
+        if doc_id is not None:
+            self._docs[doc_id] = None
+
+    def _link(self, kind:str, pairs):
+        '''add (pid, term id) links of given relation kind, in ascending doc id order. links of unindexed pids are skipped.'''
+        links = sorted((self._ids[pid], tid) for pid, tid in pairs if pid in self._ids)
+        for doc_id, tid in links:
+            posting = self._term_ids[kind][tid]
+            if not posting or posting[-1] != doc_id:
+                posting.append(doc_id)
+
+    def _load_terms(self, session):
+        for kind, (_, term, term_id, term_name) in SEARCH_RELATIONS.items():
+            self._names[kind] = dict(session.query(getattr(term, term_id), getattr(term, term_name)).all())
+            self._terms[kind] = {tid: normalize(name) for tid, name in self._names[kind].items()}
+
+class KeywordIndexRegistry(RefreshableStore):
+    '''
+        Per-database keyword indexes of the worker, refreshed lazily from the request path.
+        see RefreshableStore for refresh_interval, rebuild_interval and session_factory.
+    '''
+    def __init__(self, refresh_interval:float=60, rebuild_interval:float=3600, session_factory=None):
+        super().__init__(refresh_interval, rebuild_interval, session_factory)
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, database:str)->KeywordIndex:
+        with self._lock:
+            index = self._indexes.get(database)
+            if index is None:
+                index = self._indexes[database] = KeywordIndex(database)
+            return index
+
+    def get_fresh(self, database:str, session)->KeywordIndex:
+        '''return index of given database, building or refreshing it when it is out of date.'''
+        return self.ensure_fresh(self.get(database), session, database)
+
+    def expire(self, database:str):
+        '''make the next search of given database refresh its index, such as after ingesting postings.'''
+        with self._lock:
+            index = self._indexes.get(database)
+        if index is not None and index.is_built:
+            index.refreshed_at = float("-inf")
@@ -0,0 +1,154 @@
+import json, zlib
+from datetime import date, datetime, time
+from decimal import Decimal
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_DEFAULTS = {
+    "enabled": True,
+    "minimum_size": 1024,
+    "gzip_level": 6,
+    "zstd_level": 3,
+}
+# bodies at least this large are compressed in the threadpool, so they do not hold the event loop
+THREADPOOL_COMPRESSION_SIZE = 256 * 1024
+# bodies that are compressed already, or do not shrink
+UNCOMPRESSED_MEDIA_TYPES = ("application/vnd.apache.parquet", "application/gzip", "application/zstd", "image/", "video/", "audio/")
+
+def json_default(value):
+    '''convert values the json encoder cannot encode, the same way FastAPI renders them.'''
+    if isinstance(value, (datetime, date, time)):
+        # NaT of pandas is a datetime that does not equal itself
+        return value.isoformat() if value == value else None
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, bytes):
+        return value.decode(errors="replace")
+    if hasattr(value, "item"):
+        # numpy scalars
+        return value.item()
+    return str(value)
+
+def dumps(content)->bytes:
+    '''encode content as compact JSON with orjson when installed, encoding datetimes natively and NaN as null.'''
+    if orjson is not None:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, default=json_default, separators=(",", ":")).encode()
+
+class FastJSONResponse(JSONResponse):
+    '''JSON response rendered by dumps. returned directly from endpoints, it also skips jsonable_encoder.'''
+    def render(self, content)->bytes:
+        return dumps(content)
+
+def available_encodings()->list:
+    '''return content encodings this worker can produce, in order of preference.'''
+    return (["zstd"] if zstandard is not None else []) + ["gzip"]
+
+def negotiate_encoding(accept_encoding:str):
+    '''return preferred encoding accepted by given Accept-Encoding header, or None to send the body as is.'''
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, *options = [part.strip().lower() for part in item.split(";")]
+        quality = 1.0
+        for option in options:
+            if option.startswith("q="):
+                try:
+                    quality = float(option[2:])
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            accepted[coding] = quality
+    candidates = []
+    for preference, encoding in enumerate(available_encodings()):
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0:
+            candidates.append((-quality, preference, encoding))
+    return min(candidates)[2] if candidates else None
+
+class Compressor():
+    '''incremental gzip or zstd compressor, flushing every chunk so streamed responses stay incremental.'''
+    def __init__(self, encoding:str, options:dict):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=options.get("zstd_level", COMPRESSION_DEFAULTS["zstd_level"])).compressobj()
+        else:
+            self._compressor = zlib.compressobj(options.get("gzip_level", COMPRESSION_DEFAULTS["gzip_level"]), zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, chunk:bytes)->bytes:
+        flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK if self.encoding == "zstd" else zlib.Z_SYNC_FLUSH
+        return self._compressor.compress(chunk) + self._compressor.flush(flush_mode)
+
+    def finish(self, chunk:bytes=b"")->bytes:
+        return self._compressor.compress(chunk) + self._compressor.flush()
+
+class CompressionMiddleware():
+    '''
+        Compress response bodies with the encoding negotiated from Accept-Encoding, zstd when available or else gzip.
+        - options: dictionary of COMPRESSION_DEFAULTS keys, read per request so it can be updated from configuration.
+          bodies smaller than minimum_size are sent as is, while streamed bodies are always compressed.
+    '''
+    def __init__(self, app, options:dict=None):
+        self.app = app
+        self.options = options if options is not None else dict(COMPRESSION_DEFAULTS)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.options.get("enabled", True):
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        options = self.options
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body, more_body = message.get("body", b""), message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                media_type = headers.get("content-type", "")
+                small = not more_body and len(body) < options.get("minimum_size", COMPRESSION_DEFAULTS["minimum_size"])
+                if "content-encoding" in headers or small or media_type.startswith(UNCOMPRESSED_MEDIA_TYPES):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = Compressor(encoding, options)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                    await send(start_message)
+                else:
+                    body = await run_in_threadpool(compressor.finish, body) if len(body) >= THREADPOOL_COMPRESSION_SIZE else compressor.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+            chunk = compressor.compress(body) if more_body else compressor.finish(body)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+        # responses without body messages, such as HEAD responses, are started once the app returns
+        if start_message is not None and compressor is None and not passthrough:
+            await send(start_message)
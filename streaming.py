@@ -0,0 +1,98 @@
+import re
+from bisect import bisect_right
+from sqlalchemy import text
+from serialization import dumps
+from utils import Logger
+
+logger = Logger()
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+DEFAULT_YIELD_PER = 1000
+IDENTIFIER_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def to_ndjson_line(record)->bytes:
+    return dumps(record) + b"\n"
+
+def to_ndjson_chunk(records)->bytes:
+    '''join NDJSON lines of given records into one body chunk, so rows are not sent one message each.'''
+    return b"".join(dumps(record) + b"\n" for record in records)
+
+def stream_rows(engine, statement, params:dict=None, row_to_record=None, yield_per:int=DEFAULT_YIELD_PER):
+    '''
+        Yield NDJSON lines for the rows of given statement, fetched through a server-side cursor.
+        Lines are yielded as one chunk per partition of yield_per rows, so the first rows go out as soon as they are fetched.
+        The connection is held only while the response is being streamed.
+        - engine: engine of database to query
+        - statement: sqlalchemy statement, or plain SQL string sent to the driver as is
+        - params(optional): parameters of the statement
+        - row_to_record(optional): callable converting a row to a json serializable object. if not set, rows are sent as dictionaries.
+        - yield_per(optional): number of rows fetched from the server cursor at once
+    '''
+    method_name = __name__ + ".stream_rows"
+    if row_to_record is None:
+        row_to_record = lambda row: dict(row._mapping)
+    try:
+        with engine.connect() as connection:
+            connection = connection.execution_options(stream_results=True, yield_per=yield_per)
+            if isinstance(statement, str):
+                result = connection.exec_driver_sql(statement)
+            else:
+                result = connection.execute(statement, params or {})
+            for partition in result.partitions(yield_per):
+                yield to_ndjson_chunk(row_to_record(row) for row in partition)
+    except Exception as e:
+        # headers are already sent, so the error is reported as the last line of the stream
+        logger.log(f"Exception occurred while streaming rows: {e}", flag=1, name=method_name)
+        yield to_ndjson_line({"error": str(e)})
+
+async def astream_rows(engine, statement, params:dict=None, row_to_record=None, yield_per:int=DEFAULT_YIELD_PER):
+    '''async counterpart of stream_rows for asyncio engines. plain SQL strings are sent with their colons escaped.'''
+    method_name = __name__ + ".astream_rows"
+    if row_to_record is None:
+        row_to_record = lambda row: dict(row._mapping)
+    if isinstance(statement, str):
+        statement = text(statement.replace(":", "\\:"))
+    try:
+        async with engine.connect() as connection:
+            result = await connection.stream(statement.execution_options(yield_per=yield_per), params or {})
+            async for partition in result.partitions(yield_per):
+                yield to_ndjson_chunk(row_to_record(row) for row in partition)
+    except Exception as e:
+        logger.log(f"Exception occurred while streaming rows: {e}", flag=1, name=method_name)
+        yield to_ndjson_line({"error": str(e)})
+
+def stream_values(values, row_to_record, chunk_size:int=DEFAULT_YIELD_PER):
+    '''yield NDJSON lines for values already held in memory, chunk_size values per chunk.'''
+    values = list(values)
+    for start in range(0, len(values), chunk_size):
+        yield to_ndjson_chunk(row_to_record(value) for value in values[start:start+chunk_size])
+
+def paginate_sorted(values:list, cursor=None, limit:int=None):
+    '''
+        return page of sorted values strictly after cursor and the cursor of the next page.
+        next cursor is None when the page is the last one.
+    '''
+    start = bisect_right(values, cursor) if cursor is not None else 0
+    if limit is None:
+        return values[start:], None
+    page = values[start:start+limit]
+    next_cursor = page[-1] if page and start + limit < len(values) else None
+    return page, next_cursor
+
+def keyset_query(query:str, key_column:str, cursor=None, limit:int=None):
+    '''
+        Wrap given SQL query so that rows are ordered by key_column and start after cursor.
+        return wrapped query and its parameters.
+    '''
+    if not IDENTIFIER_PATTERN.match(key_column):
+        raise ValueError(f"Invalid key column: {key_column}")
+    wrapped = f"SELECT * FROM ({query.strip().rstrip(';')}) AS keyset_page"
+    params = {}
+    if cursor is not None:
+        wrapped += f" WHERE keyset_page.{key_column} > :cursor"
+        params["cursor"] = cursor
+    wrapped += f" ORDER BY keyset_page.{key_column}"
+    if limit is not None:
+        wrapped += " LIMIT :limit"
+        params["limit"] = limit
+    return wrapped, params
@@ -0,0 +1,44 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, select, text
+from model import Base, JobInformation, DevStack, JobStack
+from ingest import TermLookup, ingest_postings
+
+def make_connection():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    connection = engine.connect()
+    # compare term names case-insensitively, as MySQL collations do
+    connection.execute(text("DROP TABLE dev_stack"))
+    connection.execute(text("CREATE TABLE dev_stack (did VARCHAR(255) NOT NULL PRIMARY KEY, dev_stack VARCHAR(255) NOT NULL COLLATE NOCASE)"))
+    connection.execute(JobInformation.__table__.insert(), [
+        {"pid": "p1", "job_title": "Backend Engineer", "site_symbol": "AA", "company_name": "Acme", "get_date": datetime(2024, 1, 1)},
+        {"pid": "p2", "job_title": "Data Analyst", "site_symbol": "BB", "company_name": "Globex", "get_date": datetime(2024, 1, 1)},
+    ])
+    connection.execute(DevStack.__table__.insert(), [{"did": "d1", "dev_stack": "Python"}])
+    connection.commit()
+    return connection
+
+def test_partial_and_full_postings_in_one_chunk():
+    connection = make_connection()
+    result = ingest_postings(connection, "jobs", [
+        {"pid": "p1", "company_name": "Initech"},
+        {"pid": "p2", "job_title": "Data Engineer", "site_symbol": "CC"},
+        {"pid": "p3", "job_title": "Frontend Developer", "site_symbol": "DD"},
+    ], TermLookup())
+    assert result["rows"]["job_information"] == 3
+    jobs = {row.pid: row for row in connection.execute(select(JobInformation)).all()}
+    assert (jobs["p1"].job_title, jobs["p1"].site_symbol, jobs["p1"].company_name) == ("Backend Engineer", "AA", "Initech")
+    assert (jobs["p2"].job_title, jobs["p2"].site_symbol, jobs["p2"].company_name) == ("Data Engineer", "CC", "Globex")
+    assert (jobs["p3"].job_title, jobs["p3"].site_symbol) == ("Frontend Developer", "DD")
+
+def test_terms_differing_in_case_reuse_the_stored_term():
+    connection = make_connection()
+    result = ingest_postings(connection, "jobs", [{"pid": "p1", "dev_stacks": ["python"]}], TermLookup())
+    assert result["created_terms"] == {"dev_stack": 0}
+    assert connection.execute(select(JobStack.pid, JobStack.did)).all() == [("p1", "d1")]
+    assert connection.execute(select(DevStack.did)).scalars().all() == ["d1"]
+
+def test_chunk_size_must_be_positive():
+    with pytest.raises(ValueError):
+        ingest_postings(make_connection(), "jobs", [{"pid": "p1"}], TermLookup(), chunk_size=0)
@@ -0,0 +1,44 @@
+import asyncio
+from query_cache import QueryResultCache, CachedResponse, normalize_sql, referenced_tables
+
+def test_normalize_sql_keeps_alias_case():
+    assert normalize_sql("SELECT  COUNT(*) AS Total\n FROM job_information;") == "SELECT COUNT(*) AS Total FROM job_information"
+    assert normalize_sql("SELECT COUNT(*) AS Total FROM job_information") != normalize_sql("SELECT COUNT(*) AS total FROM job_information")
+
+def test_referenced_tables_of_table_lists_and_functions():
+    assert referenced_tables("SELECT * FROM job_stack j, dev_stack s WHERE j.did = s.did") == {"job_stack", "dev_stack"}
+    assert referenced_tables("SELECT EXTRACT(YEAR FROM get_date) AS year FROM job_information") == {"job_information"}
+    assert referenced_tables("SELECT * FROM (SELECT pid FROM job_stack) x, `db`.`Dev_Stack`") == {"job_stack", "dev_stack"}
+    # a table list that cannot be read leaves the statement untagged
+    assert referenced_tables("SELECT * FROM job_stack, ") == frozenset()
+
+def test_aliases_differing_in_case_are_cached_apart():
+    cache = QueryResultCache()
+    async def lookup(sql, alias):
+        async def compute():
+            return CachedResponse(f'[{{"{alias}":1}}]'.encode(), "application/json")
+        return await cache.get_or_compute(cache.key("jobs", sql), compute)
+    async def run():
+        first = await lookup("SELECT COUNT(*) AS Total FROM job_information", "Total")
+        second = await lookup("SELECT COUNT(*) AS total FROM job_information", "total")
+        return first.content, second.content
+    assert asyncio.run(run()) == (b'[{"Total":1}]', b'[{"total":1}]')
+
+def test_follower_takes_over_when_leader_is_cancelled():
+    cache = QueryResultCache()
+    key = cache.key("jobs", "SELECT pid FROM job_information")
+    calls = []
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return CachedResponse(b"[]", "application/json")
+    async def run():
+        leader = asyncio.create_task(cache.get_or_compute(key, compute))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(cache.get_or_compute(key, compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*followers)
+    responses = asyncio.run(run())
+    assert [response.content for response in responses] == [b"[]"] * 3
+    assert len(calls) == 2
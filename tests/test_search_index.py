@@ -0,0 +1,41 @@
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from model import Base, JobInformation, DevStack, JobStack
+from search_index import KeywordIndex
+
+def make_session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        JobInformation(pid="p1", job_title="Backend Engineer", site_symbol="AA", company_name="Acme", get_date=datetime(2024, 1, 1)),
+        JobInformation(pid="p2", job_title="Data Analyst", site_symbol="BB", company_name="Globex", get_date=datetime(2024, 1, 1)),
+        DevStack(did="d1", dev_stack="Python"),
+        JobStack(pid="p2", did="d1"),
+    ])
+    session.commit()
+    return session
+
+def test_refresh_reindexes_recrawled_rows():
+    session = make_session()
+    index = KeywordIndex("jobs")
+    index.build(session)
+    assert index.search("engineer") == ["p1"]
+    assert index.search("python") == ["p2"]
+    job = session.get(JobInformation, "p1")
+    job.job_title, job.get_date = "Frontend Developer", datetime(2024, 1, 2)
+    session.add(JobStack(pid="p1", did="d1"))
+    session.commit()
+    index.refresh(session)
+    assert index.search("engineer") == []
+    assert index.search("developer") == ["p1"]
+    assert index.search("python") == ["p1", "p2"]
+    assert index.count_terms("dev_stack", {"p1", "p2"}) == {"Python": 2}
+
+def test_keyword_without_grams_falls_back_to_scan():
+    session = make_session()
+    index = KeywordIndex("jobs")
+    index.build(session)
+    assert index.search("ac") == ["p1"]
+    assert index.search("r\x00aa") == []
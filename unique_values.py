@@ -0,0 +1,147 @@
+import threading, time
+from collections import Counter, OrderedDict
+from sqlalchemy import func
+from model import JobInformation
+from refreshable import RefreshableStore
+from utils import Logger, parse_stored_list
+
+logger = Logger()
+
+# stacked values treated as empty, as in the original filter of /unique_values
+EMPTY_STACKED_VALUES = ('[]', "['null']")
+CHUNK_SIZE = 1000
+
+class UniqueValues():
+    '''
+        Value counts of one column. For tables holding pids, the values contributed by each pid are kept,
+        so rows recrawled after the get_date watermark replace their previous contribution.
+    '''
+    def __init__(self, model, column:str, is_stacked:bool):
+        self.model = model
+        self.column = model.__table__.c[column]
+        self.is_stacked = is_stacked
+        self.counts = Counter()
+        self.contributions = {}
+        self.watermark = None
+        self.built_at = None
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+
+    @property
+    def is_incremental(self)->bool:
+        '''only tables with a pid can follow get_date of job_information.'''
+        return 'pid' in self.model.__table__.c
+
+    def build(self, session):
+        method_name = __name__ + ".build"
+        start = time.perf_counter()
+        counts, contributions, watermark = Counter(), {}, None
+        if self.is_incremental:
+            for pid, values, get_date in self._iter_pid_values(session):
+                contributions[pid] = values
+                counts.update(values)
+                if get_date is not None and (watermark is None or get_date > watermark):
+                    watermark = get_date
+        elif self.is_stacked:
+            query = session.query(self.column).filter(self.column.notin_(EMPTY_STACKED_VALUES)).yield_per(CHUNK_SIZE)
+            for (value,) in query:
+                counts.update(self._parse(value))
+        else:
+            counts.update(dict(session.query(self.column, func.count()).group_by(self.column).all()))
+        with self.lock:
+            self.counts, self.contributions, self.watermark = counts, contributions, watermark
+            self.built_at = self.refreshed_at = time.monotonic()
+        logger.log(f"built unique values of {self.model.__tablename__}.{self.column.name} with {len(counts)} values in {time.perf_counter() - start:.3f}s", flag=3, name=method_name)
+
+    def refresh(self, session)->int:
+        '''
+            Apply rows crawled since the last build or refresh. tables without pid are rebuilt instead, as they are small.
+            return number of refreshed pids.
+        '''
+        if not self.is_incremental or self.built_at is None:
+            self.build(session)
+            return len(self.contributions)
+        rows = list(self._iter_pid_values(session, since=self.watermark))
+        with self.lock:
+            for pid, values, get_date in rows:
+                previous = self.contributions.get(pid)
+                if previous:
+                    self.counts.subtract(previous)
+                self.contributions[pid] = values
+                self.counts.update(values)
+                if get_date is not None and (self.watermark is None or get_date > self.watermark):
+                    self.watermark = get_date
+            # drop values no longer contributed by any row
+            for value in [value for value, count in self.counts.items() if count <= 0]:
+                del self.counts[value]
+            self.refreshed_at = time.monotonic()
+        return len(rows)
+
+    def values(self, top_n:int=None)->list:
+        '''return unique values, sorted by descending frequency when top_n is given.'''
+        with self.lock:
+            if top_n is not None:
+                return [value for value, _ in self.counts.most_common(top_n)]
+            return list(self.counts.keys())
+
+    def value_counts(self, top_n:int=None)->dict:
+        with self.lock:
+            if top_n is not None:
+                return dict(self.counts.most_common(top_n))
+            return dict(self.counts)
+
+    def _iter_pid_values(self, session, since=None):
+        '''yield (pid, values, get_date) per pid, grouping rows of relation tables by pid.'''
+        model = self.model
+        query = session.query(model.pid, self.column, JobInformation.get_date)
+        if model is not JobInformation:
+            query = query.join(JobInformation, JobInformation.pid == model.pid)
+        if since is not None:
+            query = query.filter(JobInformation.get_date >= since)
+        current_pid, current_values, current_date = None, [], None
+        for pid, value, get_date in query.order_by(model.pid).yield_per(CHUNK_SIZE):
+            if pid != current_pid and current_pid is not None:
+                yield current_pid, tuple(current_values), current_date
+                current_values = []
+            current_pid, current_date = pid, get_date
+            current_values.extend(self._parse(value) if self.is_stacked else (value,))
+        if current_pid is not None:
+            yield current_pid, tuple(current_values), current_date
+
+    def _parse(self, value)->tuple:
+        method_name = __name__ + ".parse"
+        if value is None or value in EMPTY_STACKED_VALUES:
+            return ()
+        try:
+            return parse_stored_list(value)
+        except ValueError as e:
+            logger.log(f"Error parsing row: {value}, error: {e}", flag=1, name=method_name)
+            return ()
+
+class UniqueValuesStore(RefreshableStore):
+    '''
+        Precomputed unique values and counts per (database, table, column), served from memory.
+        - max_entries: number of columns kept before the least recently used one is dropped
+        see RefreshableStore for refresh_interval, rebuild_interval and session_factory.
+    '''
+    def __init__(self, refresh_interval:float=60, rebuild_interval:float=3600, max_entries:int=256, session_factory=None):
+        super().__init__(refresh_interval, rebuild_interval, session_factory)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session, database:str, model, column:str, is_stacked:bool)->UniqueValues:
+        '''return up-to-date unique values of given column, building them on first use.'''
+        # only columns of the model get an entry, so requests cannot grow the store with unknown names
+        if column not in model.__table__.c:
+            raise ValueError(f"Unknown column {column} of table {model.__tablename__}")
+        key = (database, model.__tablename__, column, is_stacked)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = UniqueValues(model, column, is_stacked)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(key)
+        return self.ensure_fresh(entry, session, database)
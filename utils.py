@@ -1,11 +1,134 @@
-import os
+import os, sys, json, ast, glob, time, queue, atexit, threading
+from functools import lru_cache
 from datetime import datetime, timezone, timedelta
+try:
+    import fcntl
+except ImportError:  # file locking is not available on windows
+    fcntl = None
 
 parent_path = os.path.dirname(os.path.abspath(__file__))
 
+HEAD = ["DEBUG", "ERROR", "WARN", "STATUS", "INFO"]
+# severity of each flag, used for level filtering: debug < info < status < warn < error
+SEVERITY = {0: 10, 4: 20, 3: 25, 2: 30, 1: 40}
+KST = timezone(timedelta(hours=9))
+LOG_DEFAULTS = {
+    "min_level": 0,             # lowest flag written. e.g. 4 drops debug logs
+    "flush_interval": 1.0,      # seconds between flushes of buffered messages
+    "batch_size": 512,          # messages buffered before an early flush
+    "max_bytes": 50 * 1024 * 1024,  # size at which a log file is rotated
+    "rotate_when": "%Y-%m-%d",  # strftime period. a file last written in an earlier period is rotated
+    "backup_count": 14,         # rotated files kept per level
+}
+
+class LogWriter():
+    '''
+        Background writer shared by every Logger of a directory. Messages are queued by the request thread,
+        then batched, appended and rotated by a daemon thread. Appends and rotation hold an exclusive lock file,
+        so uvicorn workers sharing the directory do not interleave partial writes or rotate the same file twice.
+        - path: location directory of log files
+        - options: overrides of LOG_DEFAULTS
+    '''
+    _writers = {}
+    _writers_lock = threading.Lock()
+
+    def __init__(self, path:str, options:dict=None):
+        self.path = path
+        self.options = dict(LOG_DEFAULTS, **(options or {}))
+        self._queue = queue.SimpleQueue()
+        self._flush_requested = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    @classmethod
+    def get(cls, path:str)->"LogWriter":
+        '''return writer of given directory, started once per process.'''
+        writer = cls._writers.get(path)
+        if writer is None:
+            with cls._writers_lock:
+                writer = cls._writers.get(path)
+                if writer is None:
+                    writer = cls._writers[path] = LogWriter(path)
+        return writer
+
+    def configure(self, **options):
+        '''override writer options, such as min_level from configuration.'''
+        self.options.update({key: value for key, value in options.items() if value is not None})
+
+    def enabled(self, flag:int)->bool:
+        return SEVERITY.get(flag, 10) >= SEVERITY.get(self.options["min_level"], 10)
+
+    def put(self, record:tuple):
+        self._queue.put(record)
+        if self._queue.qsize() >= self.options["batch_size"]:
+            self._flush_requested.set()
+
+    def flush(self):
+        '''write every queued message now, from the calling thread.'''
+        self._write(self._drain())
+
+    def _run(self):
+        while True:
+            self._flush_requested.wait(self.options["flush_interval"])
+            self._flush_requested.clear()
+            try:
+                self._write(self._drain())
+            except Exception as e:
+                sys.stderr.write(f"Exception occurred while writing logs: {e}\n")
+
+    def _drain(self)->list:
+        records = []
+        while True:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                return records
+
+    def _write(self, records:list):
+        if not records:
+            return
+        files = {}
+        for created, flag, name, msg, fields in records:
+            now = datetime.fromtimestamp(created, KST).strftime("%Y-%m-%d %H:%M:%S")
+            line = f"[{now}][{HEAD[flag]}]({name}) > {msg}"
+            if fields:
+                line += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+            files.setdefault(HEAD[flag], []).append(line + "\n")
+        os.makedirs(self.path, exist_ok=True)
+        with open(f"{self.path}/.log.lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                for head, lines in files.items():
+                    log_file = f"{self.path}/{head}.log"
+                    self._rotate_if_needed(log_file)
+                    with open(log_file, "a") as f:
+                        f.write("".join(lines))
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _rotate_if_needed(self, log_file:str):
+        try:
+            stat = os.stat(log_file)
+        except FileNotFoundError:
+            return
+        when = self.options["rotate_when"]
+        written_period = datetime.fromtimestamp(stat.st_mtime, KST).strftime(when) if when else None
+        current_period = datetime.now(KST).strftime(when) if when else None
+        if stat.st_size < self.options["max_bytes"] and written_period == current_period:
+            return
+        suffix = datetime.fromtimestamp(stat.st_mtime, KST).strftime("%Y%m%d-%H%M%S")
+        os.replace(log_file, f"{log_file}.{suffix}")
+        backups = sorted(glob.glob(f"{glob.escape(log_file)}.*"))
+        for backup in backups[:max(len(backups) - self.options["backup_count"], 0)]:
+            os.remove(backup)
+
 class Logger():
     '''
         Logger for generating log messages given in string format to files under given path.
+        Messages are handed to a background LogWriter, so the calling thread never touches the files.
         - path: location directory of log files to be generated at
         - options: logger options getting inputs in dictionary format
             - name(optional): name of source logger is running at. if not set, will call __name__ variable of utils.py
@@ -16,9 +139,10 @@ class Logger():
     # if current path is ./views, than path is ../logs
     def __init__(self, options:dict=None, path=f"{parent_path}/logs"):
         self.path = path
-        self.options = options
+        self.options = options or {}
+        self.writer = LogWriter.get(path)
 
-    def log(self, msg:str, flag:int=None, name:str=None):  # 수정: 기본값을 None으로 변경
+    def log(self, msg:str, flag:int=None, name:str=None, **fields):  # 수정: 기본값을 None으로 변경
         '''
             Save given log messages according to level of depth as files.
             - flag: logs being printed will be saved according to level of depth given in flag
@@ -28,27 +152,49 @@ class Logger():
                 - 3: status
                 - 4: info
             - name(optional): name of source logger is running at. if not set, will call __name__ variable of utils.py
+            - fields(optional): structured fields appended as key=value, such as latency_ms
         '''
+        if not flag:
+            flag = 0
+        if not self.writer.enabled(flag):
+            return
         options = self.options
         if not name and options.get('name', False):  # 수정: name이 None일 때만 options에서 가져옴
             name = options.get('name')
-        if not flag:
-            flag = 0
-        head = ["DEBUG", "ERROR", "WARN", "STATUS", "INFO"]
-        utc_now = datetime.now(timezone.utc)
-        kst_now = utc_now + timedelta(hours=9)
-        now = kst_now.strftime("%Y-%m-%d %H:%M:%S")
-
-        if not os.path.isdir(self.path):
-            os.mkdir(self.path)
-
-        msg.replace("\n", " ")
-        msg.replace("  ", " ")
-        log_file = f"{self.path}/{head[flag]}.log"
-        if not name:
-            log_message = f"[{now}][{head[flag]}]({__name__}) > {msg}\n"
-        else:
-            log_message = f"[{now}][{head[flag]}]({name}) > {msg}\n"
-        
-        with open(log_file, "a") as f:
-            f.write(log_message)
+        msg = str(msg).replace("\n", " ").replace("  ", " ")
+        self.writer.put((time.time(), flag, name or __name__, msg, fields))
+
+    def flush(self):
+        self.writer.flush()
+
+def configure_logging(path:str=f"{parent_path}/logs", **options):
+    '''
+        Configure the writer of given log directory, e.g. configure_logging(min_level=4) to drop debug logs.
+        see LOG_DEFAULTS for options.
+    '''
+    LogWriter.get(path).configure(**options)
+
+def parse_list_literal(value:str)->tuple:
+    '''
+        Parse stringified list such as '["a", "b"]' or "['a', 'b']".
+        JSON is tried first since it is much faster than ast.literal_eval.
+        raise ValueError if given value is not a list literal.
+    '''
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        try:
+            parsed = ast.literal_eval(value)
+        except (SyntaxError, ValueError) as e:
+            raise ValueError(f"Invalid list literal: {value!r}") from e
+    if not isinstance(parsed, (list, tuple)):
+        raise ValueError(f"Invalid list literal: {value!r}")
+    return tuple(parsed)
+
+@lru_cache(maxsize=65536)
+def parse_stored_list(value:str)->tuple:
+    '''
+        parse_list_literal for values stored in stacked columns, which repeat across rows and are cached.
+        only values read from the database go through it, so clients cannot fill the cache with one-off values.
+    '''
+    return parse_list_literal(value)